@@ -0,0 +1,54 @@
+"""
+Response encoder benchmark.
+
+Compares the time taken to encode a response document with ``json.dumps(model.response(...))`` (using the marshmallow
+and the compiled serializers) and with :meth:`Model.response_bytes`, using synthetic records for the test models
+(no database connection is required)::
+
+    python bench/encoder.py [ROWS ...]
+"""
+import json
+import sys
+import time
+
+from jsonapi.model import RequestContext
+from jsonapi.serializer import CompiledSchema
+
+from serializer import CASES, make_recs
+
+SIZES = (1000, 10000, 100000)
+
+
+def timed(func, recs):
+    start = time.perf_counter()
+    result = func(recs)
+    return time.perf_counter() - start, result
+
+
+def run(model, args, n):
+    model.init_schema(model.parse_arguments(args))
+    elapsed, expected = timed(lambda recs: json.dumps(model.response(RequestContext(), recs)),
+                              make_recs(model, args, n))
+    yield 'marshmallow', elapsed
+
+    schema = model.schema
+    model.schema = CompiledSchema(model)
+    elapsed, _ = timed(lambda recs: json.dumps(model.response(RequestContext(), recs)), make_recs(model, args, n))
+    model.schema = schema
+    yield 'compiled', elapsed
+
+    elapsed, result = timed(lambda recs: model.response_bytes(RequestContext(), recs), make_recs(model, args, n))
+    assert json.loads(result)['data'] == json.loads(expected)['data']
+    yield 'bytes', elapsed
+
+
+def main(sizes=SIZES):
+    for cls, args in CASES:
+        for n in sizes:
+            print('{} {} ({:,} rows)'.format(cls.__name__, args, n))
+            for engine, elapsed in run(cls(), args, n):
+                print('    {:<12} {:>10.3f} sec {:>12,.0f} rows/sec'.format(engine, elapsed, n / elapsed))
+
+
+if __name__ == '__main__':
+    main(tuple(int(n) for n in sys.argv[1:]) or SIZES)
@@ -0,0 +1,70 @@
+"""
+Serializer benchmark.
+
+Compares the throughput (rows/sec) of the marshmallow and the compiled serializers, using synthetic records for the
+test models (no database connection is required)::
+
+    python bench/serializer.py [ROWS]
+"""
+import datetime as dt
+import sys
+import time
+
+from jsonapi.model import RequestContext
+from jsonapi.serializer import CompiledSchema
+from jsonapi.tests.model import ArticleModel, UserModel
+
+CASES = (
+    (UserModel, {}),
+    (ArticleModel, {}),
+    (ArticleModel, {'include': 'author,keywords'}),
+)
+
+
+def user_rec(i):
+    return dict(type='user', id=i, email='user{}@example.com'.format(i), first='First', last='Last',
+                created_on=dt.datetime(2019, 5, 18, 11, 49, 43), status='active', name='First Last')
+
+
+def article_rec(i, include):
+    rec = dict(type='article', id=i, title='Title {}'.format(i), body='Body ' * 50,
+               created_on=dt.datetime(2019, 5, 18, 11, 49, 43, tzinfo=dt.timezone.utc),
+               updated_on=None, is_published=bool(i % 2))
+    if include:
+        rec['author'] = user_rec(i % 20)
+        rec['keywords'] = [dict(type='keyword', id=i % 50 + k, name='keyword') for k in range(3)]
+    return rec
+
+
+def make_recs(model, args, n):
+    if model.type_ == 'user':
+        return [user_rec(i) for i in range(n)]
+    return [article_rec(i, 'include' in args) for i in range(n)]
+
+
+def run(model, args, n):
+    model.init_schema(model.parse_arguments(args))
+    recs = make_recs(model, args, n)
+    start = time.perf_counter()
+    expected = model.response(RequestContext(), recs)
+    elapsed = time.perf_counter() - start
+    yield 'marshmallow', n / elapsed
+
+    model.schema = CompiledSchema(model)
+    recs = make_recs(model, args, n)
+    start = time.perf_counter()
+    result = model.response(RequestContext(), recs)
+    elapsed = time.perf_counter() - start
+    assert result == expected
+    yield 'compiled', n / elapsed
+
+
+def main(n=10000):
+    for cls, args in CASES:
+        print('{} {}'.format(cls.__name__, args))
+        for engine, rate in run(cls(), args, n):
+            print('    {:<12} {:>12,.0f} rows/sec'.format(engine, rate))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -1,5 +1,10 @@
+import base64
+import binascii
+import datetime as dt
+import json
 import re
 from collections import defaultdict
+from decimal import Decimal
 
 from inflection import underscore, camelize
 
@@ -100,12 +105,48 @@ class OptionArgument:
         return '{}({}={})'.format(self.__class__.__name__, self.name, self.value)
 
 
+def _cursor_value(value):
+    if isinstance(value, (dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError('invalid cursor value: {!r}'.format(value))
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key values of a resource object as an opaque page cursor (see :class:`PageArgument`).
+    """
+    data = json.dumps(values, default=_cursor_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a page cursor: a list of sort key values (dates, times and decimal numbers are left as strings).
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)), parse_float=Decimal)
+    except (ValueError, TypeError, binascii.Error):
+        raise Error('invalid page cursor: {!r}'.format(cursor))
+    if not isinstance(values, list):
+        raise Error('invalid page cursor: {!r}'.format(cursor))
+    return values
+
+
 class PageArgument:
+    """
+    Page size and position: a page number ("page[number]"), or a cursor ("page[after]" or "page[before]").
+
+    Cursors are returned in the "meta" section of the response documents. An empty cursor selects the first page
+    ("page[after]") or the last page ("page[before]").
+    """
 
-    def __init__(self, size, number):
+    def __init__(self, size, number, after=None, before=None):
 
         self.limit = None
         self.offset = 0
+        self.cursor = None
 
         if size is None and number is not None:
             raise Error('please provide page[size]'.format(size))
@@ -128,8 +169,19 @@ class PageArgument:
                 if int(number) <= 0:
                     raise Error('invalid value for page[number]: {!r}'.format(number))
 
+        if after is not None or before is not None:
+            if size is None:
+                raise Error('please provide page[size]')
+            if number is not None:
+                raise Error('page[number] can not be combined with page[after] or page[before]')
+            if after is not None and before is not None:
+                raise Error('page[after] can not be combined with page[before]')
+            direction, cursor = ('after', after) if after is not None else ('before', before)
+            self.cursor = direction, decode_cursor(cursor) if cursor else None
+
     def __repr__(self):
-        return '{}(limit={}, offset={})'.format(self.__class__.__name__, self.limit, self.offset)
+        return '{}(limit={}, offset={}, cursor={})'.format(
+            self.__class__.__name__, self.limit, self.offset, self.cursor)
 
 
 class MergeArgument:
@@ -172,6 +224,7 @@ class RequestArguments:
         """
         args = args if args else dict()
         try:
+            self.items = tuple(sorted((str(k), str(v)) for k, v in args.items()))
             self.include = tuple(AttributePath(path)
                                  for path in args['include'].split(',')) if 'include' in args else ()
             self.fields = {f.type: f for f in (FieldArgument(k, args[k])
@@ -179,7 +232,8 @@ class RequestArguments:
             self.sort = tuple(SortArgument(spec) for spec in args['sort'].split(',')) if 'sort' in args else ()
             self.filter = self._group_filter_args(FilterArgument(k, args[k])
                                                   for k in args.keys() if k.startswith('filter'))
-            self.page = PageArgument(args.get('page[size]', None), args.get('page[number]', None))
+            self.page = PageArgument(args.get('page[size]', None), args.get('page[number]', None),
+                                     args.get('page[after]', None), args.get('page[before]', None))
             self.merge = MergeArgument(args['merge']) if 'merge' in args else None
             self.options = {o.name: o.value for o in
                             (OptionArgument(k, v) for k, v in args.items() if k.startswith('option'))}
@@ -215,6 +269,22 @@ class RequestArguments:
     def in_filter(self, name, parents):
         return any(f.path.exists(name, parents) for g in self.filter for f in g)
 
+    def key(self):
+        """
+        A hashable key identifying these arguments: the query string parameters, in sorted order.
+        """
+        return self.items
+
+    def shape(self):
+        """
+        A hashable key identifying the schema required by these arguments: fieldsets, include paths,
+        and the sort and filter paths that force fields to load.
+        """
+        return (tuple(sorted((t, tuple(sorted(f.names))) for t, f in self.fields.items())),
+                tuple(sorted(set(i.names for i in self.include))),
+                tuple(sorted(set(s.path.names for s in self.sort))),
+                tuple(sorted(set(f.path.names for g in self.filter for f in g))))
+
 
 def parse_arguments(args):
     return RequestArguments(args)
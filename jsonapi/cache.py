@@ -0,0 +1,191 @@
+import sys
+import time
+from collections import OrderedDict, defaultdict
+
+from jsonapi.exc import Error
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used entry when full.
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache
+    False
+    >>> cache.stats()
+    {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 0}
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        :param int maxsize: the maximum number of entries
+        """
+        if not isinstance(maxsize, int) or maxsize <= 0:
+            raise Error('invalid cache size: {!r}'.format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return dict(size=len(self), maxsize=self.maxsize, hits=self.hits, misses=self.misses)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '<{}({}/{})>'.format(self.__class__.__name__, len(self), self.maxsize)
+
+
+def _sizeof(value):
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(val) for val in value.values())
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(val) for val in value)
+    return sys.getsizeof(value)
+
+
+class ResourceCache:
+    """
+    A bounded mapping of records, with a memory budget and a time to live, invalidated by table.
+
+    Each entry is stored with the names of the tables it was read from (see :meth:`set`), and is dropped when any of
+    them changes (see :meth:`invalidate`).
+
+    >>> cache = ResourceCache(100, maxbytes=2 ** 20, ttl=60)
+    >>> cache.set(('user', 1), {'id': 1, 'email': 'a@b.c'}, ('public.users',))
+    >>> cache.get(('user', 1))
+    {'id': 1, 'email': 'a@b.c'}
+    >>> cache.invalidate('public.users')
+    >>> cache.get(('user', 1)) is None
+    True
+    """
+
+    def __init__(self, maxsize=1024, maxbytes=None, ttl=None):
+        """
+        :param int maxsize: the maximum number of entries
+        :param int maxbytes: the (approximate) maximum size of the entries, in bytes (optional)
+        :param float ttl: the maximum age of an entry, in seconds (optional)
+        """
+        if not isinstance(maxsize, int) or maxsize <= 0:
+            raise Error('invalid cache size: {!r}'.format(maxsize))
+        if maxbytes is not None and (not isinstance(maxbytes, int) or maxbytes <= 0):
+            raise Error('invalid cache memory budget: {!r}'.format(maxbytes))
+        if ttl is not None and (not isinstance(ttl, (int, float)) or ttl <= 0):
+            raise Error('invalid cache ttl: {!r}'.format(ttl))
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._tables = defaultdict(set)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+            self.pop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, tables=()):
+        """
+        :param key: a hashable key
+        :param value: the value to cache
+        :param tables: the names of the tables the value depends on
+        """
+        self.pop(key)
+        size = _sizeof(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = value, expires, size, tuple(tables)
+        self.nbytes += size
+        for table in tables:
+            self._tables[table].add(key)
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        value, _, size, tables = entry
+        self.nbytes -= size
+        for table in tables:
+            self._tables[table].discard(key)
+            if not self._tables[table]:
+                del self._tables[table]
+        return value
+
+    def invalidate(self, table):
+        """
+        Drop the entries that depend on a table.
+
+        :param str table: a (schema qualified) table name
+        """
+        for key in list(self._tables.get(table, ())):
+            self.pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._tables.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return dict(size=len(self), maxsize=self.maxsize, nbytes=self.nbytes, maxbytes=self.maxbytes,
+                    hits=self.hits, misses=self.misses)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '<{}({}/{})>'.format(self.__class__.__name__, len(self), self.maxsize)
@@ -1,5 +1,6 @@
 import datetime as dt
 import json
+import re
 
 import marshmallow as ma
 from sqlalchemy.sql import sqltypes
@@ -47,6 +48,7 @@ class DataType:
             - parser: function for parsing a value from string
             - filter_ops: a sequence of supported operators (for single values)
             - filter_ops_multi: sequence of supported operators (for multiple values)
+            - json_parser: function for converting a value from its PostgreSQL JSON representation
 
         >>> import marshmallow as ma
         >>> from sqlalchemy as sa
@@ -65,6 +67,7 @@ class DataType:
         self.ma_type = self.get_ma_type(ma_type)
         self.sa_types = tuple(self.get_sa_type(sa_type) for sa_type in sa_types)
         self.parser = kwargs.get('parser', str)
+        self.json_parser = kwargs.get('json_parser', None)
         self.filter_clause = FilterClause(
             self, *kwargs.get('filter_ops', (Operator.NONE,)),
             multiple=kwargs.get('filter_ops_multi', None))
@@ -102,6 +105,18 @@ class DataType:
         else:
             return res
 
+    def parse_many(self, values):
+        """
+        Parse a list of values. Unless some of the values are null (or invalid), the null check is done once for the
+        whole list, and the values are passed straight to the parser.
+        """
+        if set(map(str.lower, values)).isdisjoint(DataType.VALUES_NULL):
+            try:
+                return list(map(self.parser, values))
+            except ValueError:
+                pass
+        return [self.parse(val) for val in values]
+
     @staticmethod
     def get(expr):
         if expr is not None and hasattr(expr, 'type'):
@@ -155,6 +170,23 @@ def parse_datetime(val):
     raise ValueError
 
 
+def _isoformat(val):
+    return re.sub(r'\.(\d+)', lambda m: '.' + m.group(1)[:6].ljust(6, '0'), val)
+
+
+def parse_json_date(val):
+    return dt.date.fromisoformat(val)
+
+
+def parse_json_time(val):
+    return dt.time.fromisoformat(_isoformat(val))
+
+
+def parse_json_datetime(val):
+    res = dt.datetime.fromisoformat(_isoformat(val))
+    return res.astimezone(dt.timezone.utc) if res.tzinfo is not None else res
+
+
 Bool = DataType(
     ma.fields.Bool,
     sqltypes.Boolean,
@@ -187,6 +219,7 @@ Date = DataType(
     ma.fields.Date,
     sqltypes.Date,
     parser=parse_date,
+    json_parser=parse_json_date,
     filter_ops=(Operator.GT, Operator.LT),
     filter_ops_multi=(Operator.NONE, Operator.EQ, Operator.NE))
 
@@ -194,6 +227,7 @@ Time = DataType(
     ma.fields.Time,
     sqltypes.Time,
     parser=parse_time,
+    json_parser=parse_json_time,
     filter_ops=(Operator.GT, Operator.LT),
     filter_ops_multi=(Operator.NONE, Operator.EQ, Operator.NE))
 
@@ -202,6 +236,7 @@ DateTime = DataType(
     ma.fields.DateTime,
     sqltypes.DateTime,
     parser=parse_datetime,
+    json_parser=parse_json_datetime,
     filter_ops=(Operator.GT, Operator.LT),
     filter_ops_multi=(Operator.NONE, Operator.EQ, Operator.NE))
 
@@ -214,4 +249,4 @@ class JSONField(ma.fields.Field):
         return json.dumps(value)
 
 
-JSON = DataType(JSONField, sqltypes.JSON)
+JSON = DataType(JSONField, sqltypes.JSON, json_parser=json.dumps)
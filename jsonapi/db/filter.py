@@ -1,15 +1,24 @@
 import enum
 import re
 
+from sqlalchemy import all_, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import and_, operators, or_, cast
 
 from jsonapi.exc import Error
+from .statement import get_binds
 from .table import Cardinality, PathJoin, is_clause, is_from_item
 
 MODIFIERS = {'=': operators.eq, '<>': operators.ne, '!=': operators.ne,
              '>=': operators.ge, '<=': operators.le,
              '>': operators.gt, '<': operators.lt}
 
+FILTER_ARRAY_SIZE = 100
+"""
+The minimum number of values of a multiple value filter (without modifiers) sent as a single array parameter
+(``= ANY(...)``) rather than as an ``IN`` list with a parameter per value
+"""
+
 
 class Operator(enum.Enum):
     NONE = ''
@@ -28,6 +37,8 @@ class FilterBy(PathJoin):
         self.from_items.extend(from_items)
         self.where = [where] if where is not None else list()
         self.having = list()
+        self.binds = list()
+        self.shape = () if where is None and not from_items else None
 
     def __bool__(self):
         return any((self.where, self.having, self.from_items))
@@ -39,9 +50,12 @@ class FilterBy(PathJoin):
             field = self.load(model, arg.path)
             if field.is_relationship():
                 attr = field.model.fields['id']
-                where.append(attr.filter_clause.get(attr.expr, arg.operator, arg.value))
+                clause = attr.filter_clause.get(attr.expr, arg.operator, arg.value)
+                where.append(clause)
+                self._add_shape(arg, attr.filter_clause, clause)
             else:
                 clause = field.filter_clause.get(field.expr, arg.operator, arg.value)
+                self._add_shape(arg, field.filter_clause, clause)
                 if field.is_aggregate():
                     self.from_items.extend(field.rel.get_from_items())
                     having.append(clause)
@@ -52,7 +66,13 @@ class FilterBy(PathJoin):
         if having:
             self.having.append(or_(*having))
 
+    def _add_shape(self, arg, filter_clause, clause):
+        self.binds.extend(get_binds(clause))
+        if self.shape is not None:
+            self.shape += ((arg.path.names, filter_clause.shape(arg.operator, arg.value)),)
+
     def add_custom(self, name, custom_clause):
+        self.shape = None
         if is_clause(custom_clause):
             self.where.append(custom_clause)
         else:
@@ -110,6 +130,36 @@ class FilterClause:
         else:
             return [('=', self.data_type.parse(v)) for v in val.split(',')]
 
+    @staticmethod
+    def is_array(val):
+        """
+        Check if the values of a filter are sent as a single array parameter (see :data:`FILTER_ARRAY_SIZE`).
+        """
+        return val.count(',') + 1 >= FILTER_ARRAY_SIZE and not any(symbol in val for symbol in MODIFIERS)
+
+    @staticmethod
+    def match_null(expr, op, clause=None):
+        """
+        Extend the clause of a multiple value filter containing null, which never equals a value: null values are
+        matched (or excluded, for the ``ne`` operator) with ``IS NULL`` (``IS NOT NULL``), as in the modifier syntax.
+        """
+        if op == 'ne':
+            return expr.isnot(None) if clause is None else and_(clause, expr.isnot(None))
+        return expr.is_(None) if clause is None else or_(clause, expr.is_(None))
+
+    def shape(self, op, val):
+        """
+        Identify the structure of the clause returned by :meth:`get`: the operator, the number of values, and
+        the position of values rendered as SQL literals (``NULL``, ``true``, and ``false``).
+        """
+        if ',' in val and self.is_array(val):
+            return op, list, any(v.lower() in self.data_type.VALUES_NULL for v in val.split(','))
+        if ',' in val:
+            return op, tuple((mod, v if v is None or v is True or v is False else '')
+                             for mod, v in self.parse_values(val))
+        v = self.data_type.parse(val)
+        return op, v if v is None or v is True or v is False else ''
+
     def get(self, expr, op, val):
 
         #
@@ -119,14 +169,24 @@ class FilterClause:
             if not self.has_operator(op, multiple=True):
                 raise Error('invalid operator: {}'.format(op))
 
+            if self.is_array(val) and op in ('', 'eq', 'ne'):
+                values = self.data_type.parse_many(val.split(','))
+                array_type = ARRAY(expr.type)
+                array = cast(bindparam(None, [v for v in values if v is not None], type_=array_type,
+                                       unique=True), array_type)
+                clause = expr == any_(array) if op != 'ne' else expr != all_(array)
+                return self.match_null(expr, op, clause) if None in values else clause
+
             values = self.parse_values(val)
             if all(mod == '=' for mod, _ in values):
-                if op in ('', 'eq'):
-                    return expr.in_(val for _, val in values)
-                elif op == 'ne':
-                    return expr.notin_(val for _, val in values)
-                else:
+                if op not in ('', 'eq', 'ne'):
                     raise Error('invalid operator: {}')
+                values = [val for _, val in values]
+                if None not in values:
+                    return expr.in_(values) if op != 'ne' else expr.notin_(values)
+                values = [val for val in values if val is not None]
+                clause = (expr.in_(values) if op != 'ne' else expr.notin_(values)) if values else None
+                return self.match_null(expr, op, clause)
             else:
                 expressions = list()
                 for i, (mod, val) in enumerate(values):
@@ -0,0 +1,77 @@
+"""
+Change Notifications.
+
+The triggers created by :func:`create_triggers` send a notification on the :data:`NOTIFY_CHANNEL` channel after each
+statement that modifies one of the tables a model is read from, with the schema qualified table name as the payload.
+Use :func:`listen` to handle the notifications, for example, to invalidate cached records::
+
+    >>> from jsonapi.model import resource_cache
+    >>> from jsonapi.tests.model import KeywordModel, UserModel
+    >>>
+    >>> for sql in create_triggers(UserModel(), KeywordModel()):
+    >>>     await pg.execute(sql)
+    >>> await listen(connection, resource_cache.invalidate)
+"""
+from sqlalchemy.sql.util import find_tables
+
+from jsonapi.fields import Relationship
+
+NOTIFY_CHANNEL = 'jsonapi_changes'
+"""
+The name of the notification channel
+"""
+
+NOTIFY_FUNCTION = 'jsonapi_notify'
+"""
+The name of the trigger function (and of the triggers) created by :func:`create_triggers`
+"""
+
+
+def get_table_name(table):
+    return '{}.{}'.format(table.schema or 'public', table.name)
+
+
+def get_tables(model):
+    """
+    Get the names of the tables a model is read from: the tables in the model's FROM clause, the tables
+    referenced by its relationships, and the tables its access decisions depend on (see
+    :attr:`jsonapi.model.Model.access_tables`).
+
+    :param model: a model instance
+    :return: a set of schema qualified table names
+    """
+    tables = set(get_table_name(table) for table in find_tables(model.from_clause()))
+    for field in model.fields.values():
+        if isinstance(field, Relationship):
+            tables.update(get_table_name(ref.table) for ref in field.refs)
+    tables.update(get_table_name(table) for table in model.access_tables)
+    return tables
+
+
+def create_triggers(*models):
+    """
+    Generate the statements creating the notification triggers for the tables of one or more models.
+
+    :param models: a variable length list of model instances
+    :return: a list of SQL statements
+    """
+    statements = ["CREATE OR REPLACE FUNCTION {0}() RETURNS trigger AS $$ BEGIN "
+                  "PERFORM pg_notify('{1}', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME); RETURN NULL; "
+                  "END $$ LANGUAGE plpgsql".format(NOTIFY_FUNCTION, NOTIFY_CHANNEL)]
+    for table in sorted(set(table for model in models for table in get_tables(model))):
+        statements.append('DROP TRIGGER IF EXISTS {0} ON {1}'.format(NOTIFY_FUNCTION, table))
+        statements.append('CREATE TRIGGER {0} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {1} '
+                          'FOR EACH STATEMENT EXECUTE PROCEDURE {0}()'.format(NOTIFY_FUNCTION, table))
+    return statements
+
+
+async def listen(connection, callback):
+    """
+    Call a function with the table name of each change notification received.
+
+    The connection must be dedicated to listening (not returned to the pool) for as long as notifications are needed.
+
+    :param connection: an asyncpg connection
+    :param callback: a function accepting a schema qualified table name
+    """
+    await connection.add_listener(NOTIFY_CHANNEL, lambda conn, pid, channel, payload: callback(payload))
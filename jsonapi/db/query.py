@@ -1,13 +1,31 @@
 import operator
+import re
+from functools import reduce
 
 import sqlalchemy as sa
+from inflection import camelize
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.sql.util import find_tables
 
-from jsonapi.exc import APIError, ModelError
-from jsonapi.fields import Aggregate, Field
-from .table import Cardinality, FromClause, FromItem, get_primary_key
+from jsonapi.datatypes import DataType, Date, DateTime, Float
+from jsonapi.exc import APIError, Error, ModelError
+from jsonapi.fields import Aggregate, Field, Relationship
+from .statement import Parameters, compile_statement
+from .table import Cardinality, FromClause, FromItem, RowLevelSecurity, get_primary_key
 
-SQL_PARAM_LIMIT = 10000
 SEARCH_LABEL = '_ts_rank'
+ACCESS_LABEL = '_access'
+EMBED_LABEL = '_embed'
+WINDOW_LABEL = '_total'
+KEY_LABEL = '_key'
+PAGE_LABEL = '_page'
+ORDER_LABEL = '_order'
+RENDER_LABEL = '_json'
+VERSION_LABEL = '_version'
+TOTAL_LABELS = ('total', 'filtered', 'search')
+"""
+Column labels of the counts selected by ``totals`` queries: all objects, filtered objects and search results
+"""
 
 
 class QueryArguments:
@@ -18,10 +36,30 @@ class QueryArguments:
         self.order_by = kwargs.get('order_by', None)
         self.search_term = kwargs.get('search_term', None)
         self.count = bool(kwargs.get('count', False))
+        self.totals = bool(kwargs.get('totals', False))
+        self.window = bool(kwargs.get('window', False))
+        self.keyset = kwargs.get('keyset', None)
+        self.deferred = bool(kwargs.get('deferred', False))
+        self.render = bool(kwargs.get('render', False))
+        self.version = bool(kwargs.get('version', False))
         self.limit = kwargs.get('limit', None)
         self.offset = kwargs.get('offset', 0)
         self.exclude = set(kwargs.get('exclude', set()))
         self.options = kwargs.get('options', None)
+        self.embed = tuple(kwargs.get('embed', ()))
+
+    def shape(self):
+        """
+        A hashable key identifying the statement structure implied by these arguments, or ``None`` if the
+        arguments include custom clauses.
+        """
+        if self.where is not None or (self.filter_by is not None and self.filter_by.shape is None):
+            return None
+        return (self.filter_by.shape if self.filter_by is not None else None,
+                self.order_by.shape if self.order_by is not None else None,
+                ' ' in self.search_term if self.search_term is not None else None,
+                self.count, self.totals, self.window, self.limit is not None, _embed_shape(self.embed),
+                _keyset_shape(self.keyset), _is_deferred(self), self.render, self.version)
 
     def __repr__(self):
         return '{}({})'.format(self.__class__.__name__,
@@ -33,65 +71,106 @@ class QueryArguments:
 ########################################################################################################################
 
 def exists(model, obj_id):
-    return sa.select([sa.exists(sa.select([model.primary_key]).where(_where_one(model, obj_id)))])
+    return compile_statement(
+        _shape('exists', model, None, _id_shape(obj_id)), Parameters(**_id_values(obj_id)),
+        lambda params: sa.select([sa.exists(sa.select([model.primary_key]).where(
+            _where_one(model, obj_id, params)))]))
 
 
-def select_one(model, obj_id):
-    query = sa.select(from_obj=_from_obj(model), columns=_col_list(model), whereclause=_where_one(model, obj_id))
-    query = _group_query(model, query)
-    query = _protect_query(model, query)
-    return query
+def select_one(model, obj_id, embed=()):
+    return compile_statement(
+        _shape('one', model, None, _id_shape(obj_id), _embed_shape(embed)),
+        _parameters(model, None, embed, **_id_values(obj_id)),
+        lambda params: _embed_query(_select_one(model, obj_id, params), embed, params))
+
+
+def select_access(model, obj_ids):
+    """
+    Select the ids of a set of objects, along with their access flag (see :data:`ACCESS_LABEL`) if the model is
+    protected. The ids are sent as a single array parameter.
+    """
+    return compile_statement(
+        _shape('access', model, None), _parameters(model, None, obj_ids=list(obj_ids)),
+        lambda params: sa.select(
+            [model.primary_key.label('id'), *([_access_column(model, params)] if _checks_access(model) else [])],
+            from_obj=_from_obj(model, aggregates=False), whereclause=_any(model.primary_key, params, 'obj_ids')))
 
 
 def select_many(model, **kwargs):
     qa = QueryArguments(**kwargs)
-    query = sa.select(columns=_col_list(model, order_by=qa.order_by, search_term=qa.search_term),
-                      from_obj=_from_obj(model, filter_by=qa.filter_by, order_by=qa.order_by,
-                                         search_term=qa.search_term))
-    if qa.where is not None:
-        query = query.where(qa.where)
+    return compile_statement(_shape('many', model, qa), _parameters(model, qa, qa.embed),
+                             lambda params: _select_many(model, qa, params))
 
-    query = _protect_query(model, query)
-    if not qa.count:
-        query = _sort_query(model, query, qa.order_by, qa.search_term)
-        if qa.limit is not None:
-            query = query.offset(qa.offset).limit(qa.limit)
-    query = _group_query(model, query, filter_by=qa.filter_by, order_by=qa.order_by, search_term=qa.search_term)
-    query = _filter_query(query, qa.filter_by, qa.limit)
-    query = _search_query(model, query, qa.search_term)
-    return _count_query(query) if qa.count else query
 
+def select_version(model, obj_id=None, **kwargs):
+    """
+    Select the number of objects and their version (see :attr:`jsonapi.model.Model.version`): either a single
+    object, or all the objects matched by the ``where``, ``filter_by`` and ``search_term`` arguments.
 
-def select_related(rel, obj_id, **kwargs):
-    qa = QueryArguments(**kwargs)
-    parent_col = rel.parent_col.label('parent_id') if isinstance(obj_id, list) else None
-    query = sa.select(columns=_col_list(rel.model, parent_col, order_by=qa.order_by, search_term=qa.search_term),
-                      from_obj=_from_obj(rel.model, *rel.get_from_items(True), filter_by=qa.filter_by,
-                                         order_by=qa.order_by, search_term=qa.search_term))
-    if qa.where is not None:
-        query = query.where(qa.where)
-    if not isinstance(obj_id, list):
-        query = query.where(rel.parent_col == obj_id)
+    :return: a query returning a single (count, version) row
+    """
+    qa = QueryArguments(count=True, version=True, **kwargs)
+    if obj_id is None:
+        return compile_statement(_shape('version', model, qa, model.version), _parameters(model, qa),
+                                 lambda params: _select_version(model, qa, params))
+    return compile_statement(
+        _shape('version', model, None, model.version, _id_shape(obj_id)),
+        _parameters(model, None, **_id_values(obj_id)),
+        lambda params: _count_query(_protect_query(model, sa.select(
+            [_version_column(model)], from_obj=_from_obj(model, aggregates=False),
+            whereclause=_where_one(model, obj_id, params)), params), model))
 
-    query = _protect_query(rel.model, query)
-    if not qa.count:
-        if rel.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY):
-            query = _sort_query(rel.model, query, qa.order_by, qa.search_term)
-        if qa.limit is not None:
-            query = query.offset(qa.offset).limit(qa.limit)
-    query = _group_query(rel.model, query, parent_col,
-                         filter_by=qa.filter_by, order_by=qa.order_by, search_term=qa.search_term)
-    query = _filter_query(query, qa.filter_by, qa.limit)
-    query = _search_query(rel.model, query, qa.search_term)
-    if isinstance(obj_id, list):
-        return (query.where(rel.parent_col.in_(x))
-                for x in (obj_id[i:i + SQL_PARAM_LIMIT]
-                          for i in range(0, len(obj_id), SQL_PARAM_LIMIT)))
-    return _count_query(query) if qa.count else query
+
+def select_related(rel, obj_id, **kwargs):
+    """
+    Select the related objects of a single parent object or, if ``obj_id`` is a list, of many parent objects (along
+    with a "parent_id" column). The parent ids of a list are sent as a single array parameter, so the statement text
+    does not depend on the number of parents.
+    """
+    return _select_related(rel, QueryArguments(**kwargs), obj_id)
+
+
+def select_linkage(links):
+    """
+    Select the resource linkage of one or more relationships, without the related records. The parent ids of each
+    relationship are sent as a single array parameter, so the statement text does not depend on the number of parents.
+
+    :param links: a sequence of (relationship, parent object ids) pairs
+    :return: a query returning (rel, parent_id, id) rows, where ``rel`` is the index of the relationship in ``links``
+    """
+    return compile_statement(
+        ('linkage', tuple((rel.parent.name, rel.name) for rel, _ in links)),
+        Parameters(**{'parent_ids_{:d}'.format(i): list(obj_ids) for i, (_, obj_ids) in enumerate(links)}),
+        lambda params: _union_all([_select_linkage(i, rel, params) for i, (rel, _) in enumerate(links)]))
+
+
+def select_objects(model, obj_ids):
+    """
+    Select a set of objects by id. The ids are sent as a single array parameter.
+    """
+    qa = QueryArguments()
+    return compile_statement(_shape('objects', model, qa), _parameters(model, qa, obj_ids=list(obj_ids)),
+                             lambda params: _select_many(model, qa, params).where(
+                                 _any(model.primary_key, params, 'obj_ids')))
+
+
+def select_reltuples(model):
+    """
+    Select the query planner's estimate of the number of rows in the primary table of a model (negative if the
+    table has not been analyzed yet).
+    """
+    table = model.primary_key.table
+    table = table.original if isinstance(table, sa.sql.Alias) else table
+    pg_class = sa.table('pg_class', sa.column('oid'), sa.column('reltuples'))
+    return compile_statement(
+        ('reltuples', table.fullname), Parameters(table=table.fullname),
+        lambda params: sa.select([pg_class.c.reltuples]).where(
+            pg_class.c.oid == sa.func.to_regclass(params.bind('table', sa.Text))))
 
 
 def select_merged(model, rel, obj_ids, **kwargs):
     qa = QueryArguments(**kwargs)
+    params = _parameters(rel.model, qa)
     query = sa.select(columns=_col_list(rel.model),
                       from_obj=_from_obj(rel.model, *rel.get_from_items(True),
                                          filter_by=qa.filter_by, order_by=qa.order_by))
@@ -120,17 +199,25 @@ def select_merged(model, rel, obj_ids, **kwargs):
     if len(qa.exclude) > 0:
         arr_len_excluded = coalesce(array_length(array(sa.select('*').select_from(unnest(array_agg(merge_col))).except_(
             sa.select([unnest(sa.cast(include, sa.ARRAY(sa.Integer)))]))), sa.text('1')), sa.text('0'))
-        query = query.having(sa.and_(merge_op(arr_len_merged, merge_count), exc_op(arr_len_excluded, exc_count)))
+        having = sa.and_(merge_op(arr_len_merged, merge_count), exc_op(arr_len_excluded, exc_count))
     else:
-        query = query.having(merge_op(arr_len_merged, merge_count))
+        having = merge_op(arr_len_merged, merge_count)
 
+    if qa.totals:
+        return _totals_query(
+            rel.model, qa, params, *rel.get_from_items(True), whereclause=model.primary_key.in_(obj_ids),
+            having=having, search=False,
+            count=lambda **kwargs: select_merged(model, rel, obj_ids, exclude=qa.exclude, options=qa.options,
+                                                 count=True, **kwargs))
+
+    query = query.having(having)
     query = _group_query(rel.model, query, filter_by=qa.filter_by, order_by=qa.order_by, force=True)
     query = _filter_query(query, qa.filter_by, qa.limit)
-    query = _protect_query(rel.model, query)
+    query = _protect_query(rel.model, query, params)
     if not qa.count:
-        query = _sort_query(rel.model, query, qa.order_by, qa.search_term)
+        query = _sort_query(rel.model, query, qa.order_by, qa.search_term, params)
         if qa.limit is not None:
-            query = query.offset(qa.offset).limit(qa.limit)
+            query = _page_query(query, params)
     return _count_query(query) if qa.count else query
 
 
@@ -138,12 +225,12 @@ def select_mixed(models, **kwargs):
     qa = QueryArguments(**kwargs)
     if qa.count:
         return ((model.type_, _count_query(_protect_query(
-            model, sa.select([model.primary_key])))) for model in models)
+            model, sa.select([model.primary_key]), _parameters(model, qa)))) for model in models)
     queries = list()
     for model in models:
         queries.append(_protect_query(model, sa.select([
             model.primary_key.label('id'), model.primary_key.table,
-            sa.func.lower(model.type_).label('resource_type')])))
+            sa.func.lower(model.type_).label('resource_type')]), _parameters(model, qa)))
     union = sa.union(*queries)
     if qa.limit is not None:
         union = union.limit(qa.limit).offset(qa.offset)
@@ -154,15 +241,16 @@ def search_query(models, term, **kwargs):
     qa = QueryArguments(**kwargs)
     if qa.count:
         return ((model.type_, _count_query(_protect_query(
-            model, sa.select([model.primary_key])))) for model in models)
+            model, sa.select([model.primary_key]), _parameters(model, qa)))) for model in models)
     queries = list()
     for model in models:
+        params = _parameters(model, qa, search_term=term)
         query = sa.select(columns=[model.primary_key.label('id'),
                                    sa.func.lower(model.type_).label('resource_type'),
-                                   _rank_column(model, term)],
+                                   _rank_column(model, params)],
                           from_obj=_from_obj(model, search_term=term))
-        query = _search_query(model, query, term)
-        queries.append(_protect_query(model, query))
+        query = _search_query(model, query, term, params)
+        queries.append(_protect_query(model, query, params))
 
     union = sa.union(*queries)
     if qa.limit is not None:
@@ -174,11 +262,190 @@ def search_query(models, term, **kwargs):
 # helpers
 ########################################################################################################################
 
-def _where_one(model, obj_id):
+def _select_one(model, obj_id, params):
+    columns = _col_list(model)
+    if _checks_access(model):
+        columns.append(_access_column(model, params))
+    query = sa.select(from_obj=_from_obj(model), columns=columns,
+                      whereclause=_where_one(model, obj_id, params))
+    return _group_query(model, query)
+
+
+def _select_many(model, qa, params):
+    if qa.totals:
+        return _totals_query(model, qa, params, count=lambda **kwargs: _select_many(
+            model, QueryArguments(count=True, **kwargs), params))
+    if _is_deferred(qa):
+        order = [(PAGE_LABEL, False, None)]
+        return _render_query(model, _embed_query(_deferred_query(model, qa, params), qa.embed, params, order=order),
+                             qa, order)
+    keys = _key_columns(qa)
+    query = sa.select(columns=_col_list(model, *keys, order_by=qa.order_by, search_term=qa.search_term),
+                      from_obj=_from_obj(model, filter_by=qa.filter_by, order_by=qa.order_by,
+                                         search_term=qa.search_term))
+    if qa.where is not None:
+        query = query.where(qa.where)
+
+    query = _protect_query(model, query, params)
+    if not qa.count:
+        query = _sort_query(model, query, qa.order_by, qa.search_term, params, qa.keyset)
+        query = _keyset_query(model, query, qa, params)
+        if qa.limit is not None:
+            query = _page_query(query, params)
+    query = _group_query(model, query, *keys,
+                         filter_by=qa.filter_by, order_by=qa.order_by, search_term=qa.search_term)
+    query = _filter_query(query, qa.filter_by, qa.limit)
+    query = _search_query(model, query, qa.search_term, params)
+    if qa.count:
+        return _count_query(query)
+    query, order = _order_columns(_window_query(query, qa), _outer_order(model, qa, params))
+    return _render_query(model, _embed_query(query, qa.embed, params, order=order), qa, order)
+
+
+def _select_version(model, qa, params):
+    """
+    Select the number of objects and their version, with only the joins required to filter and search: attribute
+    and aggregate fields are not selected. Filters on relationship paths may match an object more than once, so the
+    rows are grouped by primary key in that case.
+    """
+    grouped = bool(qa.filter_by and (qa.filter_by.having or qa.filter_by.from_items))
+    version = _version_column(model)
+    query = sa.select([model.primary_key, sa.func.max(version.element).label(VERSION_LABEL) if grouped else version],
+                      from_obj=_from_obj(model, filter_by=qa.filter_by, search_term=qa.search_term, aggregates=False))
+    if qa.where is not None:
+        query = query.where(qa.where)
+    query = _protect_query(model, query, params)
+    query = _search_query(model, query, qa.search_term, params)
+    if grouped:
+        query = query.group_by(model.primary_key)
+    query = _filter_query(query, qa.filter_by, None)
+    return _count_query(query, model)
+
+
+def _select_related(rel, qa, obj_id):
+    if isinstance(obj_id, list):
+        values = dict(parent_ids=obj_id)
+        shape = _shape('related', rel.model, qa, rel.parent.name, rel.name, list)
+    else:
+        values = dict(parent_id=obj_id)
+        shape = _shape('related', rel.model, qa, rel.parent.name, rel.name)
+    return compile_statement(shape, _parameters(rel.model, qa, qa.embed, **values),
+                             lambda params: _build_related(rel, qa, obj_id, params))
+
+
+def _build_related(rel, qa, obj_id, params):
+    if qa.totals:
+        return _totals_query(rel.model, qa, params, *rel.get_from_items(True),
+                             whereclause=rel.parent_col == params.bind('parent_id', rel.parent_col.type),
+                             count=lambda **kwargs: _build_related(
+                                 rel, QueryArguments(count=True, **kwargs), obj_id, params))
+    if _is_deferred(qa) and not isinstance(obj_id, list) \
+            and rel.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY):
+        return _embed_query(_deferred_query(
+            rel.model, qa, params, *rel.get_from_items(True),
+            whereclause=rel.parent_col == params.bind('parent_id', rel.parent_col.type)), qa.embed, params,
+            order=[(PAGE_LABEL, False, None)])
+    parent_col = rel.parent_col.label('parent_id') if isinstance(obj_id, list) else None
+    keys = _key_columns(qa)
+    query = sa.select(columns=_col_list(rel.model, parent_col, *keys, order_by=qa.order_by,
+                                        search_term=qa.search_term),
+                      from_obj=_from_obj(rel.model, *rel.get_from_items(True), filter_by=qa.filter_by,
+                                         order_by=qa.order_by, search_term=qa.search_term))
+    if qa.where is not None:
+        query = query.where(qa.where)
+    if not isinstance(obj_id, list):
+        query = query.where(rel.parent_col == params.bind('parent_id', rel.parent_col.type))
+
+    query = _protect_query(rel.model, query, params)
+    if not qa.count:
+        if rel.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY):
+            query = _sort_query(rel.model, query, qa.order_by, qa.search_term, params, qa.keyset)
+            query = _keyset_query(rel.model, query, qa, params)
+        if qa.limit is not None:
+            query = _page_query(query, params)
+    query = _group_query(rel.model, query, parent_col, *keys,
+                         filter_by=qa.filter_by, order_by=qa.order_by, search_term=qa.search_term)
+    query = _filter_query(query, qa.filter_by, qa.limit)
+    query = _search_query(rel.model, query, qa.search_term, params)
+    if isinstance(obj_id, list):
+        return query.where(_any(rel.parent_col, params, 'parent_ids'))
+    if qa.count:
+        return _count_query(query)
+    is_many = rel.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY)
+    query, order = _order_columns(_window_query(query, qa), _outer_order(rel.model, qa, params) if is_many else [])
+    return _embed_query(query, qa.embed, params, order=order)
+
+
+def _select_linkage(i, rel, params):
+    from_clause = FromClause(*rel.model.from_clause)
+    from_clause.add(*rel.get_from_items(True))
+    return sa.select(columns=[sa.literal_column('{:d}'.format(i), sa.Integer).label('rel'),
+                              rel.parent_col.label('parent_id'), rel.model.primary_key.label('id')],
+                     from_obj=from_clause(),
+                     whereclause=_any(rel.parent_col, params, 'parent_ids_{:d}'.format(i)))
+
+
+def _any(col, params, name):
+    """
+    Match a column against a list of values, sent as a single array parameter (``col = ANY(CAST($n AS type[]))``).
+    """
+    array = ARRAY(col.type)
+    return col == sa.any_(sa.cast(params.bind(name, array), array))
+
+
+def _shape(name, model, qa, *extra):
+    """
+    The statement cache key: ``None`` if the statement can not be cached.
+    """
+    qa_shape = qa.shape() if qa is not None else None
+    if qa is not None and qa_shape is None:
+        return None
+    return (name, _model_shape(model), qa_shape, *extra)
+
+
+def _model_shape(model):
+    fields = tuple((name, bool(field.exclude), bool(field.sort_by), field.expr is not None)
+                   for name, field in model.fields.items() if not isinstance(field, Relationship))
+    protect = (_user_id(model) is None, _grants(model) is not None) if model.access is not None else None
+    return model.name, fields, protect
+
+
+def _embed_shape(embed):
+    return tuple((rel.name, _model_shape(rel.model), _embed_shape(nested)) for rel, nested in embed)
+
+
+def _parameters(model, qa, embed=(), **values):
+    params = Parameters(user_id=_user_id(model), grants=_grants(model), **values)
+    for rel in _embedded(embed):
+        params.values[_user_slot(rel.model)] = _user_id(rel.model)
+        params.values[_grants_slot(_user_slot(rel.model))] = _grants(rel.model)
+    if qa is not None:
+        params.values.update(limit=qa.limit, offset=qa.offset)
+        if qa.search_term is not None:
+            params.values.setdefault('search_term', qa.search_term)
+        if qa.filter_by:
+            params.extend('filter', qa.filter_by.binds)
+        if qa.keyset is not None and qa.keyset[1] is not None:
+            params.values.update(('cursor_{:d}'.format(i), value) for i, value in enumerate(qa.keyset[1]))
+    return params
+
+
+def _id_shape(obj_id):
+    return tuple(obj_id.keys()) if isinstance(obj_id, dict) else None
+
+
+def _id_values(obj_id):
     if isinstance(obj_id, dict):
-        return sa.and_(model.fields[name].expr == sa.cast(val, model.fields[name].expr.type)
-                       for name, val in obj_id.items())
-    return model.primary_key == sa.cast(obj_id, model.primary_key.type)
+        return {'obj_id_{}'.format(name): val for name, val in obj_id.items()}
+    return dict(obj_id=obj_id)
+
+
+def _where_one(model, obj_id, params):
+    if isinstance(obj_id, dict):
+        return sa.and_(model.fields[name].expr == sa.cast(
+            params.bind('obj_id_{}'.format(name), model.fields[name].expr.type), model.fields[name].expr.type)
+                       for name in obj_id.keys())
+    return model.primary_key == sa.cast(params.bind('obj_id', model.primary_key.type), model.primary_key.type)
 
 
 def _col_list(model, *extra_columns, **kwargs):
@@ -199,6 +466,7 @@ def _from_obj(model, *extra_items, **kwargs):
     filter_by = kwargs.get('filter_by', None)
     order_by = kwargs.get('order_by', None)
     search_term = kwargs.get('search_term', None)
+    aggregates = kwargs.get('aggregates', True)
     from_clause = FromClause(*model.from_clause)
     from_clause.add(*extra_items)
     if filter_by:
@@ -207,10 +475,11 @@ def _from_obj(model, *extra_items, **kwargs):
         from_clause.add(*order_by.from_items)
     if model.search is not None and search_term is not None:
         from_clause.add(FromItem(model.search, onclause=model.primary_key == get_primary_key(model.search)))
-    for field in model.attributes.values():
-        if isinstance(field, Aggregate) and field.expr is not None:
-            for from_item in field.from_items[model.name]:
-                from_clause.add(from_item)
+    if aggregates:
+        for field in model.attributes.values():
+            if isinstance(field, Aggregate) and field.expr is not None:
+                for from_item in field.from_items[model.name]:
+                    from_clause.add(from_item)
     return from_clause()
 
 
@@ -243,38 +512,440 @@ def _filter_query(query, filter_by, limit):
     return query
 
 
-def _sort_query(model, query, order_by, search_term):
+def _sort_query(model, query, order_by, search_term, params, keyset=None):
+    return query.order_by(*(_order_clause(*key) for key in _order(model, order_by, search_term, params, keyset)))
+
+
+def _order(model, order_by, search_term, params, keyset=None):
+    """
+    The sort order of a query, as (expression, descending, nulls) tuples, where nulls is "first", "last" or ``None``.
+    """
+    if keyset is not None:
+        reverse = keyset[0] == 'before'
+        return [(expr, desc != reverse, 'first' if reverse else 'last') for expr, desc in _keys(model, order_by)]
     if search_term is not None and not order_by:
-        return query.order_by(_rank_column(model, search_term).desc())
+        return [(_rank_column(model, params), True, None)]
     if order_by:
-        return query.order_by(*order_by)
-    return query
+        return [(expr, desc, 'last') for expr, desc, _ in order_by.keys]
+    return []
 
 
-def _protect_query(model, query):
-    if model.access is None:
+def _order_clause(expr, desc, nulls):
+    clause = expr.desc() if desc else expr.asc()
+    return getattr(clause, 'nulls{}'.format(nulls))() if nulls else clause
+
+
+def _outer_order(model, qa, params):
+    """
+    The sort order of a page of rows selected from by :func:`_embed_query` or :func:`_render_query`.
+    """
+    if not (qa.embed or qa.render):
+        return []
+    return _order(model, qa.order_by, qa.search_term, params, qa.keyset)
+
+
+def _order_columns(query, order):
+    """
+    Select the sort keys of a query (see :data:`ORDER_LABEL`): the order of a subquery is not kept by the query
+    selecting from it, so the rows must be sorted again.
+
+    :return: the query, and its sort order as (column name, descending, nulls) tuples
+    """
+    names = ['{}_{:d}'.format(ORDER_LABEL, i) for i in range(len(order))]
+    for name, (expr, _, _) in zip(names, order):
+        query = query.column(expr.label(name))
+    return query, [(name, desc, nulls) for name, (_, desc, nulls) in zip(names, order)]
+
+
+def _reorder_query(query, rows, order):
+    """
+    Sort a query selecting from a subquery (``rows``) in the order of the subquery (see :func:`_order_columns`).
+    """
+    return query.order_by(*(_order_clause(rows.c[name], desc, nulls) for name, desc, nulls in order))
+
+
+def _keys(model, order_by):
+    """
+    The sort keys of a query, as (expression, descending) pairs, with the primary key as a tie-breaker.
+    """
+    keys = [(expr, desc) for expr, desc, _ in order_by.keys] if order_by else []
+    keys.append((model.primary_key, False))
+    return keys
+
+
+def _key_columns(qa):
+    """
+    Select the sort key values (see :data:`KEY_LABEL`), for the page cursors of a keyset paginated query.
+    """
+    if qa.keyset is None or qa.count or not qa.order_by:
+        return []
+    return [expr.label('{}_{:d}'.format(KEY_LABEL, i)) for i, (expr, _, _) in enumerate(qa.order_by.keys)]
+
+
+def _keyset_shape(keyset):
+    if keyset is None:
+        return None
+    direction, values = keyset
+    return direction, tuple(value is None for value in values) if values is not None else None
+
+
+def _keyset_query(model, query, qa, params):
+    """
+    Select the rows after (or before) the page cursor, in sort order.
+
+    Null values are sorted last, so the rows after a null key value are the rows with a null value, and a greater
+    tie-breaker.
+    """
+    if qa.keyset is None or qa.keyset[1] is None:
         return query
+    direction, values = qa.keyset
+    keys = _keys(model, qa.order_by)
+    clauses = list()
+    equal = list()
+    for i, ((expr, desc), value) in enumerate(zip(keys, values)):
+        if value is None:
+            if direction == 'before':
+                clauses.append(sa.and_(*equal, expr.isnot(None)))
+            equal.append(expr.is_(None))
+            continue
+        name = 'cursor_{:d}'.format(i)
+        if direction == 'after':
+            after = expr < params.bind(name, expr.type) if desc else expr > params.bind(name, expr.type)
+            clauses.append(sa.and_(*equal, sa.or_(after, expr.is_(None)) if i < len(keys) - 1 else after))
+        else:
+            before = expr > params.bind(name, expr.type) if desc else expr < params.bind(name, expr.type)
+            clauses.append(sa.and_(*equal, before))
+        equal.append(expr == params.bind(name, expr.type))
+    return query.where(sa.or_(*clauses) if clauses else sa.false())
+
+
+def _is_deferred(qa):
+    """
+    Check if a page is selected in two steps (see :func:`_deferred_query`).
+
+    Filters on relationship paths restrict the rows aggregate fields are computed over, so they are not deferred.
+    """
+    return qa.deferred and qa.limit is not None and not qa.count and not qa.totals and qa.keyset is None \
+        and not (qa.filter_by and qa.filter_by.from_items)
+
+
+def _deferred_query(model, qa, params, *extra_items, **kwargs):
+    """
+    Select a page of rows in two steps: the primary keys of the page are selected first, using only the joins
+    required to filter and sort, and the rest of the columns (including aggregate fields) are selected for those
+    primary keys only. The rows are numbered in sort order (see :data:`PAGE_LABEL`).
+
+    :param model: the model selected
+    :param qa: query arguments
+    :param params: statement parameters
+    :param extra_items: additional from items, for selecting the primary keys
+    :param whereclause: an additional where clause, for selecting the primary keys
+    """
+    order = list(qa.order_by) if qa.order_by else list()
+    if qa.search_term is not None and not qa.order_by:
+        order.append(_rank_column(model, params).element.desc())
+    order.append(model.primary_key.asc())
+
+    page = sa.select(columns=[model.primary_key.label('id'),
+                              sa.func.row_number().over(order_by=order).label(PAGE_LABEL)],
+                     from_obj=_from_obj(model, *extra_items, filter_by=qa.filter_by, order_by=qa.order_by,
+                                        search_term=qa.search_term, aggregates=False),
+                     whereclause=kwargs.get('whereclause', None))
+    if qa.where is not None:
+        page = page.where(qa.where)
+    page = _protect_query(model, page, params)
+    page = _search_query(model, page, qa.search_term, params)
+    if (qa.filter_by and qa.filter_by.having) or (qa.order_by and (qa.order_by.distinct or any(
+            field.is_aggregate() for _, _, field in qa.order_by.keys))):
+        columns = [model.primary_key]
+        if qa.order_by:
+            columns.extend(qa.order_by.group_by)
+        if qa.search_term is not None and model.search is not None:
+            columns.append(model.search.c.tsvector)
+        page = page.group_by(*columns)
+    page = _filter_query(page, qa.filter_by, None)
+    page = _page_query(_window_query(page.order_by(*order), qa), params).alias(PAGE_LABEL)
+
+    extra_columns = [page.c[WINDOW_LABEL]] if qa.window else []
+    query = sa.select(columns=_col_list(model, page.c[PAGE_LABEL], *extra_columns),
+                      from_obj=_from_obj(model).join(page, model.primary_key == page.c.id))
+    query = _group_query(model, query, page.c[PAGE_LABEL], *extra_columns)
+    return query.order_by(page.c[PAGE_LABEL])
+
+
+def _page_query(query, params):
+    return query.offset(params.bind('offset', sa.Integer)).limit(params.bind('limit', sa.Integer))
+
+
+def _user_id(model):
+    if model.access is None:
+        return None
     if not hasattr(model, 'user'):
         raise ModelError('"user" not defined for protected model', model)
-    return query.where(model.access(model.primary_key, model.user.id if model.user else None))
+    return model.user.id if model.user else None
+
+
+def _user_slot(model):
+    return 'user_id_{}'.format(model.name)
+
+
+def _checks_access(model):
+    """
+    Check if access to the objects of a model is checked by the queries (rather than by row-level security policies).
+    """
+    return model.access is not None and not isinstance(model.access, RowLevelSecurity)
+
+
+def _grants(model):
+    return model.get_grants() if _checks_access(model) else None
+
+
+def _grants_slot(slot):
+    return slot.replace('user_id', 'grants', 1)
+
+
+def _access_condition(model, params, slot):
+    """
+    The access condition: the ids the user is known to have access to (see
+    :meth:`jsonapi.model.Model.get_grants`) are matched first, so the access function is only called for the rest.
+    """
+    user_id = params.bind(slot) if params.values[slot] is not None else None
+    condition = model.access(model.primary_key, user_id)
+    grants = _grants_slot(slot)
+    if params.values.get(grants) is not None:
+        any_grant = model.primary_key == sa.any_(params.bind(grants, ARRAY(model.primary_key.type)))
+        condition = sa.or_(any_grant, condition)
+    return condition
 
 
-def _search_term(search_term):
-    if ' ' in search_term:
+def _protect_query(model, query, params, slot='user_id'):
+    if not _checks_access(model):
+        return query
+    return query.where(_access_condition(model, params, slot))
+
+
+def _access_column(model, params):
+    return sa.func.coalesce(_access_condition(model, params, 'user_id'), sa.false()).label(ACCESS_LABEL)
+
+
+def _search_term(params):
+    search_term = params.bind('search_term')
+    if ' ' in params.values['search_term']:
         return sa.func.cast(sa.func.plainto_tsquery(search_term), sa.Text)
     return search_term
 
 
-def _search_query(model, query, search_term):
+def _search_query(model, query, search_term, params):
     if model.search is None or search_term is None:
         return query
-    return query.where(model.search.c.tsvector.match(_search_term(search_term)))
+    return query.where(model.search.c.tsvector.match(_search_term(params)))
 
 
-def _rank_column(model, search_term):
+def _rank_column(model, params):
     return sa.func.ts_rank_cd(model.search.c.tsvector,
-                              sa.func.to_tsquery(_search_term(search_term))).label(SEARCH_LABEL)
+                              sa.func.to_tsquery(_search_term(params))).label(SEARCH_LABEL)
+
+
+def _window_query(query, qa):
+    """
+    Select the number of rows matched, before the limit and offset are applied, with each row of the page
+    (see :data:`WINDOW_LABEL`). The window function is evaluated after grouping, so each group counts once.
+    """
+    if not qa.window:
+        return query
+    return query.column(sa.func.count().over().label(WINDOW_LABEL))
 
 
-def _count_query(query):
-    return sa.select([sa.func.count()]).select_from(query.alias('count'))
+def _embedded(embed):
+    for rel, nested in embed:
+        yield rel
+        yield from _embedded(nested)
+
+
+def _embed_query(query, embed, params, name=EMBED_LABEL, order=()):
+    """
+    Embed related records in a query, as a JSON array column per relationship (see :data:`EMBED_LABEL`).
+
+    :param query: an SQLAlchemy statement
+    :param embed: a sequence of (relationship, nested embed) pairs
+    :param params: statement parameters
+    :param name: an alias name, unique within the statement
+    :param order: the sort order of the query (see :func:`_order_columns`)
+    """
+    if not embed:
+        return query
+    rows = query.alias(name)
+    columns = [rows]
+    for rel, nested in embed:
+        alias = '{}_{}'.format(name, rel.name)
+        related = sa.select(columns=_col_list(rel.model),
+                            from_obj=_from_obj(rel.model, *rel.get_from_items(True)),
+                            whereclause=rel.parent_col == rows.c.id).correlate(rows)
+        related = _protect_query(rel.model, related, params, _user_slot(rel.model))
+        related = _group_query(rel.model, related)
+        related = _embed_query(related, nested, params, alias).alias(alias + '_json')
+        columns.append(sa.select([sa.func.json_agg(sa.literal_column(related.name))]).select_from(
+            related).as_scalar().label(rel.name))
+    return _reorder_query(sa.select(columns), rows, order)
+
+
+_TO_CHAR = {'%Y': 'YYYY', '%y': 'YY', '%m': 'MM', '%d': 'DD', '%H': 'HH24', '%I': 'HH12', '%M': 'MI',
+            '%S': 'SS', '%f': 'US', '%p': 'AM', '%j': 'DDD', '%b': 'Mon', '%B': 'FMMonth', '%a': 'Dy',
+            '%A': 'FMDay', '%%': '%'}
+
+
+def _to_char_format(fmt):
+    """
+    Translate a ``strftime`` format to a PostgreSQL ``to_char`` template, with literal text double quoted.
+    """
+    template = list()
+    for i, part in enumerate(re.split(r'(%.)', fmt)):
+        if i % 2:
+            if part not in _TO_CHAR:
+                raise Error('unsupported date format: {!r}'.format(fmt))
+            template.append(_TO_CHAR[part])
+        elif part:
+            template.append('"{}"'.format(part.replace('"', '\\"')))
+    return ''.join(template)
+
+
+def _literal(name):
+    return sa.literal_column("'{}'".format(name.replace("'", "''")), sa.Text)
+
+
+def _json_value(field, col):
+    """
+    The JSON representation of an attribute value, formatted as the marshmallow field would format it.
+    """
+    if field.data_type is DateTime:
+        if getattr(col.type, 'timezone', False):
+            col = sa.func.timezone(_literal('UTC'), col)
+        return sa.func.to_char(col, _literal(_to_char_format(DataType.FORMAT_DATETIME)))
+    if field.data_type is Date:
+        return sa.func.to_char(col, _literal(_to_char_format(DataType.FORMAT_DATE)))
+    if field.data_type is Float:
+        return sa.cast(col, sa.Float)
+    return col
+
+
+def _json_object(*items):
+    """
+    Build a JSON object from a sequence of (key, value) pairs. Functions accept up to 100 arguments, so larger
+    objects are built in parts and merged.
+    """
+    parts = [sa.func.json_build_object(*(arg for item in items[i:i + 50] for arg in item))
+             for i in range(0, len(items), 50)] or [sa.func.json_build_object()]
+    if len(parts) == 1:
+        return parts[0]
+    return sa.cast(reduce(operator.concat, (sa.cast(part, JSONB) for part in parts)), sa.JSON)
+
+
+def _render_query(model, query, qa, order=()):
+    """
+    Render each row as a JSON API resource object, in the database (see :data:`RENDER_LABEL`).
+
+    The resource object is selected as text, along with the primary key and the columns used for meta data
+    (see :data:`WINDOW_LABEL` and :data:`KEY_LABEL`), in the order of the query (see :func:`_order_columns`).
+    """
+    if not qa.render:
+        return query
+    rows = query.alias(RENDER_LABEL)
+    attributes = [(_literal(camelize(name, False)), _json_value(field, rows.c[name]))
+                  for name, field in model.attributes.items() if name != 'id' and not field.exclude]
+    resource = _json_object((_literal('id'), sa.cast(rows.c.id, sa.Text)),
+                            (_literal('type'), _literal(model.type_)),
+                            (_literal('attributes'), _json_object(*attributes)))
+    columns = [rows.c.id, sa.cast(resource, sa.Text).label(RENDER_LABEL)]
+    columns.extend(col for col in rows.c if col.name.startswith((WINDOW_LABEL, KEY_LABEL)))
+    return _reorder_query(sa.select(columns), rows, order)
+
+
+def _totals_query(model, qa, params, *extra_items, **kwargs):
+    """
+    Select the ``total``, ``filtered`` and ``search`` counts (see :data:`TOTAL_LABELS`) in a single scan.
+
+    The ``total`` count is restricted by the ``where`` argument, the ``filtered`` count by the ``where`` and
+    the ``filter_by`` arguments, and the ``search`` count by the search term only. Each count is an aggregate
+    ``FILTER`` over the same rows. Aggregate (``HAVING``) filters depend on the rows left by the other filters,
+    so they are counted with a subquery each instead, in the same statement.
+
+    :param model: the model counted
+    :param qa: query arguments
+    :param params: statement parameters
+    :param extra_items: additional from items
+    :param kwargs: ``whereclause`` and ``having`` conditions applied to all counts, ``search`` (set to ``False``
+                   to count search results as ``total``), and ``count``: a function accepting ``where``,
+                   ``filter_by`` and ``search_term`` arguments and returning a count query (used for the
+                   aggregate filters)
+    """
+    whereclause = kwargs.get('whereclause', None)
+    having = kwargs.get('having', None)
+    search = kwargs.get('search', True) and qa.search_term is not None and model.search is not None
+    if (qa.filter_by and qa.filter_by.having) or (having is not None and qa.filter_by):
+        count = kwargs['count']
+        columns = [count(where=qa.where).as_scalar().label('total')]
+        if qa.filter_by:
+            columns.append(count(where=qa.where, filter_by=qa.filter_by).as_scalar().label('filtered'))
+        if qa.search_term is not None:
+            columns.append(count(search_term=qa.search_term if search else None).as_scalar().label('search'))
+        return sa.select(columns)
+
+    from_clause = FromClause(*model.from_clause)
+    from_clause.add(*extra_items)
+    conditions = dict(total=qa.where)
+    if qa.filter_by:
+        from_clause.add(*qa.filter_by.from_items)
+        where = [clause for clause in (qa.where, *qa.filter_by.where) if clause is not None]
+        conditions['filtered'] = sa.and_(*where) if where else None
+    if qa.search_term is not None:
+        conditions['search'] = None
+    if search:
+        from_clause.add(FromItem(model.search, onclause=model.primary_key == get_primary_key(model.search), left=True))
+        conditions['search'] = model.search.c.tsvector.match(_search_term(params))
+
+    grouped = having is not None or bool(qa.filter_by and qa.filter_by.from_items)
+    columns = [model.primary_key.label('id')]
+    for name in TOTAL_LABELS:
+        if name in conditions and conditions[name] is not None:
+            columns.append((sa.func.bool_or(conditions[name]) if grouped else conditions[name]).label(name))
+    rows = sa.select(columns, from_obj=from_clause(), whereclause=whereclause)
+    rows = _protect_query(model, rows, params)
+    if grouped:
+        rows = rows.group_by(model.primary_key)
+        if having is not None:
+            rows = rows.having(having)
+    rows = rows.alias('totals')
+    return sa.select([(sa.func.count() if conditions[name] is None else sa.func.count().filter(rows.c[name]))
+                      .label(name) for name in TOTAL_LABELS if name in conditions]).select_from(rows)
+
+
+def _union_all(queries):
+    return sa.union_all(*queries) if len(queries) > 1 else queries[0]
+
+
+def _count_query(query, model=None):
+    query = query.alias('count')
+    columns = [sa.func.count()]
+    if model is not None:
+        func = sa.func.max if model.version is not None else sa.func.sum
+        columns.append(func(query.c[VERSION_LABEL]).label(VERSION_LABEL))
+    return sa.select(columns).select_from(query)
+
+
+def _row_tables(model):
+    tables = find_tables(model.from_clause(), include_aliases=True)
+    aliased = set(table.element for table in tables if isinstance(table, sa.sql.expression.Alias))
+    return [table for table in tables if table not in aliased]
+
+
+def _version_column(model):
+    """
+    The version of a row: the version column of the model if set, otherwise the sum of the transaction ids of the
+    table rows (``xmin``), which change whenever a row is updated.
+    """
+    if model.version is not None:
+        return model.get_expr(model.version).label(VERSION_LABEL)
+    xmin = [sa.func.coalesce(sa.cast(sa.cast(sa.column('xmin', _selectable=table), sa.Text), sa.BigInteger),
+                            sa.literal_column('0'))
+            for table in _row_tables(model)]
+    return reduce(operator.add, xmin).label(VERSION_LABEL)
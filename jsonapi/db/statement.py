@@ -0,0 +1,300 @@
+"""
+Statement Cache.
+
+Statements generated by :mod:`jsonapi.db.query` are compiled once per query shape (the model, loaded fields, joins,
+filter operators, sort order, and the presence of limit, offset, and search arguments). The compiled SQL text is kept
+in :data:`statement_cache`, together with the position of each bound value. Subsequent statements of the same shape
+skip building and compiling the SQLAlchemy statement: only the bound values are collected and the cached SQL text is
+executed on one of the pool connections, which keep a prepared statement for each distinct SQL text.
+
+Within a :func:`session`, statements are executed on the connection of the session instead (or on the connection of
+a :func:`transaction`, if passed explicitly).
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from asyncpgsa import pg
+from asyncpgsa.connection import compile_query, get_dialect
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter
+
+from jsonapi.cache import LRUCache
+
+STATEMENT_CACHE_SIZE = 1024
+"""
+The maximum number of compiled statements kept in :data:`statement_cache`
+"""
+
+statement_cache = LRUCache(STATEMENT_CACHE_SIZE)
+"""
+Compiled statements keyed by query shape
+"""
+
+_dialect = get_dialect()
+
+
+def get_binds(clause):
+    """
+    Get the bound parameters of a clause, in traversal order.
+    """
+    return [element for element in visitors.iterate(clause, {}) if isinstance(element, BindParameter)]
+
+
+class Parameters:
+    """
+    The values that vary between statements of the same shape.
+
+    Values are bound by name (see :meth:`bind`) while the statement is built, so the position of each value in the
+    compiled statement can be recorded and reused.
+    """
+
+    def __init__(self, **values):
+        self.values = values
+        self.slots = dict()
+
+    def bind(self, name, type_=None):
+        bind = sa.bindparam(None, self.values[name], type_=type_, unique=True)
+        self.slots[id(bind)] = name, bind
+        return bind
+
+    def extend(self, prefix, binds):
+        """
+        Register parameters bound outside of the statement builder (for example, by a filter clause).
+        """
+        for i, bind in enumerate(binds):
+            name = '{}_{:d}'.format(prefix, i)
+            self.values[name] = bind.effective_value
+            self.slots[id(bind)] = name, bind
+
+    def slot(self, bind):
+        if id(bind) in self.slots and self.slots[id(bind)][1] is bind:
+            return self.slots[id(bind)][0]
+
+
+class Statement:
+    """
+    SQL text with positional parameters, ready to be executed.
+    """
+
+    def __init__(self, sql, args):
+        self.sql = sql
+        self.args = args
+
+    def __str__(self):
+        return self.sql
+
+    def __repr__(self):
+        return '<{}({!r})>'.format(self.__class__.__name__, self.args)
+
+
+class StatementTemplate:
+    """
+    A compiled statement and the source of each positional parameter: either a named value (see :class:`Parameters`)
+    or a constant.
+    """
+
+    def __init__(self, query, params):
+        compiled = query.compile(dialect=_dialect)
+        names = sorted(compiled.params.keys())
+        self.sql = compiled.string % {name: '${:d}'.format(i) for i, name in enumerate(names, start=1)}
+        self.args = list()
+        slots = set()
+        for name in names:
+            processor = compiled._bind_processors.get(name)
+            slot = params.slot(compiled.binds[name])
+            if slot is None:
+                value = compiled.params[name]
+                self.args.append((None, processor(value) if processor else value, None))
+            else:
+                self.args.append((slot, None, processor))
+                slots.add(slot)
+        self.complete = slots == set(name for name, _ in params.slots.values())
+
+    def __call__(self, params):
+        args = list()
+        for slot, value, processor in self.args:
+            if slot is not None:
+                value = params.values[slot]
+                if processor is not None:
+                    value = processor(value)
+            args.append(value)
+        return Statement(self.sql, args)
+
+
+def compile_statement(shape, params, build):
+    """
+    Get a compiled statement from the cache, or build and compile a new one.
+
+    :param shape: a hashable key identifying the statement shape, or ``None`` if the statement can not be cached
+    :param Parameters params: the values to bind
+    :param build: a function accepting the ``params`` object and returning an SQLAlchemy statement
+    :return: a :class:`Statement` or an SQLAlchemy statement (if the shape is ``None``)
+    """
+    if shape is None:
+        return build(params)
+    template = statement_cache.get(shape)
+    if template is None:
+        template = StatementTemplate(build(params), params)
+        if template.complete:
+            statement_cache[shape] = template
+    return template(params)
+
+
+class Session:
+    """
+    A pool connection (in a transaction) shared by the statements of a request (see :func:`session`).
+
+    Statements are executed one at a time, since a connection can not run concurrent statements.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = asyncio.Lock()
+
+    async def run(self, name, *args):
+        async with self.lock:
+            return await getattr(self.connection, name)(*args)
+
+    def __repr__(self):
+        return '<{}>'.format(self.__class__.__name__)
+
+
+_session = ContextVar('session', default=None)
+
+
+@asynccontextmanager
+async def transaction(settings=None, **kwargs):
+    """
+    Start a session (see :class:`Session`) that is not bound to the current context: statements are executed on its
+    connection when it is passed to :func:`fetch`, :func:`fetchrow`, :func:`fetchval`, :func:`cursor` or
+    :func:`estimate`. Asynchronous generators (which may be resumed and closed in a different context) use it instead
+    of :func:`session`.
+
+    >>> async with transaction({'app.user_id': '1'}, readonly=True) as current:
+    >>>     await fetch(query, current)
+
+    Inside a :func:`session`, the session is shared.
+
+    :param dict settings: setting values (strings) keyed by setting name
+    :param kwargs: transaction options (``isolation``, ``readonly`` and ``deferrable``)
+    """
+    if _session.get() is not None:
+        yield _session.get()
+        return
+    async with pg.transaction(**kwargs) as connection:
+        for name, value in (settings or {}).items():
+            await connection.execute('SELECT set_config($1, $2, true)', name, value)
+        yield Session(connection)
+
+
+@asynccontextmanager
+async def session(settings=None):
+    """
+    Execute the statements of the enclosed block on a single pool connection, in a transaction, with one or more
+    settings set for the duration of the transaction (as with ``SET LOCAL``).
+
+    >>> async with session({'app.user_id': '1'}):
+    >>>     await fetch(query)
+
+    Blocks nested in a session share its connection (and settings). Without settings, no session is started.
+
+    :param dict settings: setting values (strings) keyed by setting name
+    """
+    if not settings or _session.get() is not None:
+        yield _session.get()
+        return
+    async with transaction(settings) as current:
+        token = _session.set(current)
+        try:
+            yield current
+        finally:
+            _session.reset(token)
+
+
+class _SessionCursor:
+    """
+    A server-side cursor on the connection of a session. Rows are fetched in batches, each while holding the lock
+    of the session, so other statements can run on the connection between batches.
+    """
+
+    def __init__(self, current, query, prefetch):
+        self.current = current
+        self.query = query
+        self.prefetch = prefetch or 50
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __aiter__(self):
+        return self._rows()
+
+    async def _rows(self):
+        async with self.current.lock:
+            rows = await self.current.connection.cursor(*_args(self.query))
+        while True:
+            async with self.current.lock:
+                batch = await rows.fetch(self.prefetch)
+            if not batch:
+                return
+            for row in batch:
+                yield row
+
+
+def _args(query):
+    if isinstance(query, Statement):
+        return (query.sql, *query.args)
+    return query,
+
+
+async def _run(name, query, current=None):
+    current = current or _session.get()
+    if current is None:
+        return await getattr(pg, name)(*_args(query))
+    return await current.run(name, *_args(query))
+
+
+async def fetch(query, current=None):
+    return await _run('fetch', query, current)
+
+
+async def fetchrow(query, current=None):
+    return await _run('fetchrow', query, current)
+
+
+async def fetchval(query, current=None):
+    return await _run('fetchval', query, current)
+
+
+def cursor(query, prefetch=None, current=None):
+    """
+    Open a server-side cursor (in a read only transaction, or in the transaction of a session) to iterate over the
+    rows returned by a query.
+
+    >>> async with cursor(query) as rows:
+    >>>     async for row in rows:
+    >>>         ...
+
+    :param current: a session started by :func:`transaction` (optional, defaults to the current :func:`session`)
+    """
+    current = current or _session.get()
+    if current is not None:
+        return _SessionCursor(current, query, prefetch)
+    return pg.query(*_args(query), prefetch=prefetch)
+
+
+async def estimate(query, current=None):
+    """
+    Get the query planner's estimate of the number of rows returned by a query, without running it.
+    """
+    if not isinstance(query, Statement):
+        query = Statement(*compile_query(query))
+    plan = await _run('fetchval', Statement('EXPLAIN (FORMAT JSON) {}'.format(query.sql), query.args), current)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
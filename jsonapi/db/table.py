@@ -5,7 +5,7 @@ from functools import reduce
 from sqlalchemy.exc import NoForeignKeysError
 from sqlalchemy.sql.elements import BinaryExpression, BooleanClauseList
 from sqlalchemy.sql.schema import Column, Table
-from sqlalchemy.sql import Alias, Selectable, Join
+from sqlalchemy.sql import Alias, Select, Selectable, Join, false
 
 from jsonapi.exc import APIError, Error
 
@@ -58,6 +58,8 @@ class OrderBy(PathJoin):
         super().__init__()
         self.order_by = list()
         self.group_by = list()
+        self.keys = list()
+        self.shape = ()
 
         if model:
             for arg in args:
@@ -74,13 +76,16 @@ class OrderBy(PathJoin):
 
     def add(self, model, arg):
         field = self.load(model, arg.path)
+        self.shape += ((arg.path.names, arg.desc),)
         if field.is_relationship():
             attr = field.model.fields['id']
             expr = getattr(attr.expr, 'desc' if arg.desc else 'asc')
             self.order_by.append(expr().nullslast())
+            self.keys.append((attr.expr, arg.desc, attr))
         else:
             expr = getattr(field.expr, 'desc' if arg.desc else 'asc')
             self.order_by.append(expr().nullslast())
+            self.keys.append((field.expr, arg.desc, field))
             if field.is_aggregate():
                 self.from_items.extend(field.rel.get_from_items())
                 if field.rel.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY):
@@ -249,6 +254,72 @@ class FromClause:
         return ''
 
 
+class AccessSet:
+    """
+    Set-based object-level access protection (see :attr:`jsonapi.model.Model.access`).
+
+    Instead of calling an SQL function for each row, the objects are restricted to the ids selected by a query
+    (for example, from an access control table or a view with user id and object id columns), which PostgreSQL plans
+    as a semi-join. The function providing the query accepts the current user id (a bound parameter).
+
+    >>> import sqlalchemy as sa
+    >>> from jsonapi.tests.db import articles_t, article_read_access_t
+    >>> AccessSet(lambda user_id: sa.union(
+    >>>     sa.select([articles_t.c.id]).where(articles_t.c.author_id == user_id),
+    >>>     sa.select([article_read_access_t.c.article_id]).where(article_read_access_t.c.user_id == user_id)))
+    <AccessSet>
+    """
+
+    def __init__(self, select_ids):
+        """
+        :param select_ids: a function accepting a user id and returning a query selecting a single column of ids
+        """
+        if not callable(select_ids):
+            raise Error('[AccessSet] invalid "select_ids" argument: {!r}'.format(select_ids))
+        self.select_ids = select_ids
+
+    def __call__(self, id_col, user_id):
+        """
+        The access condition for the objects identified by ``id_col``: no object is accessible if ``user_id`` is
+        ``None``.
+        """
+        if user_id is None:
+            return false()
+        query = self.select_ids(user_id)
+        if isinstance(query, Select):
+            query = query.correlate(None)
+        return id_col.in_(query)
+
+    def __repr__(self):
+        return '<{}>'.format(self.__class__.__name__)
+
+
+class RowLevelSecurity:
+    """
+    Object-level access protection by the row-level security policies of the tables (see
+    :attr:`jsonapi.model.Model.access`).
+
+    The queries of a request run in a :func:`session <jsonapi.db.statement.session>`, with a setting holding the id of
+    the current user (an empty string if no user is logged in), which the policies refer to. No access condition is
+    added to the queries. Objects the current user can not access are not visible at all, so a missing object and an
+    object the user can not access can not be told apart.
+
+    >>> RowLevelSecurity()
+    <RowLevelSecurity(app.user_id)>
+    """
+
+    def __init__(self, setting='app.user_id'):
+        """
+        :param str setting: the name of the setting holding the id of the current user
+        """
+        if not isinstance(setting, str) or '.' not in setting:
+            raise Error('[RowLevelSecurity] invalid "setting" argument: {!r}'.format(setting))
+        self.setting = setting
+
+    def __repr__(self):
+        return '<{}({})>'.format(self.__class__.__name__, self.setting)
+
+
 def get_table(table_or_alias):
     if hasattr(table_or_alias, 'element'):
         return get_table(table_or_alias.element)
@@ -47,6 +47,13 @@ class NotFound(APIError):
         self.object_id = object_id
 
 
+class NotModified(APIError):
+
+    def __init__(self, etag, model):
+        super().__init__('not modified: {}'.format(etag), model, 304)
+        self.etag = etag
+
+
 class Forbidden(APIError):
 
     def __init__(self, object_id, model):
@@ -9,6 +9,53 @@ from jsonapi.exc import Error, ModelError
 from jsonapi.registry import model_registry, schema_registry
 
 
+class Included(ma.fields.Nested):
+    """
+    The marshmallow field of a relationship.
+
+    Related records are serialized once per type and id, no matter how many include paths refer to them: a resource
+    reached again is taken from the included resources of the request, and only the relationships of the path it is
+    reached by are added to it.
+    """
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        if self.many:
+            return [self.include(rec) for rec in value]
+        return self.include(value)
+
+    def include(self, rec):
+        schema = self.schema
+        resources = schema.context['root'].included[rec['type']]
+        object_id = schema.fields['id'].serialize('id', rec)
+        resource = resources.get(object_id)
+        if resource is None:
+            resources[object_id] = resource = schema.dump(rec)
+            return resource
+        for name, field in schema.fields.items():
+            if not isinstance(field, Included) or field.load_only:
+                continue
+            linkage = resource.setdefault('relationships', dict())
+            if name in linkage and not any(isinstance(f, Included) for f in field.schema.fields.values()):
+                continue
+            value = field.serialize(name, rec)
+            if name not in linkage:
+                linkage[name] = get_linkage(value)
+        return resource
+
+
+def get_linkage(value):
+    """
+    Get the resource linkage of one or more resource objects (or ``None``).
+    """
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [dict(id=resource['id'], type=resource['type']) for resource in value]
+    return dict(id=value['id'], type=value['type'])
+
+
 class BaseField:
     """ The base class for all field types """
 
@@ -37,7 +84,7 @@ class BaseField:
 
     def get_ma_field(self):
         if isinstance(self, Relationship):
-            return ma.fields.Nested(
+            return Included(
                 schema_registry['{}Schema'.format(self.model.name)](),
                 many=self.cardinality in (Cardinality.ONE_TO_MANY,
                                           Cardinality.MANY_TO_MANY))
@@ -74,6 +121,8 @@ class Field(BaseField):
         self.col = col
 
     def load(self, model):
+        if self.expr is not None:
+            return
         if self.name == 'id':
             self.expr = model.primary_key
         elif isinstance(self.col, Column):
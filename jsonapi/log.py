@@ -13,4 +13,5 @@ if 'JSONAPI_DEBUG' in os.environ:
 
 
 def log_query(query):
-    logger.info(sqlparse.format(str(query), reindent=True))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(sqlparse.format(str(query), reindent=True))
@@ -1,22 +1,32 @@
+import asyncio
+import hashlib
+import json
 from collections import defaultdict
 from collections.abc import Sequence, Set
 from copy import copy, deepcopy
-from functools import reduce
+from decimal import Decimal
+from functools import wraps
 
 import marshmallow as ma
-from asyncpgsa import pg
 from inflection import camelize, dasherize, underscore
 from sqlalchemy.sql.expression import ColumnCollection, cast
 
-from jsonapi.args import parse_arguments
-from jsonapi.datatypes import String
+from jsonapi.args import AttributePath, encode_cursor, parse_arguments
+from jsonapi.cache import LRUCache, ResourceCache
+from jsonapi.datatypes import Float, String
 from jsonapi.db.filter import FilterBy
-from jsonapi.db.query import exists, search_query, select_many, select_merged, select_mixed, select_one, select_related
-from jsonapi.db.table import Cardinality, FromClause, FromItem, OrderBy, get_primary_key, is_from_item
-from jsonapi.exc import APIError, Error, Forbidden, ModelError, NotFound, LargeResult
-from jsonapi.fields import Aggregate, BaseField, Field, Relationship
+from jsonapi.db.notify import get_tables
+from jsonapi.db.query import ACCESS_LABEL, KEY_LABEL, RENDER_LABEL, WINDOW_LABEL, search_query, select_access, \
+    select_linkage, select_many, select_merged, select_mixed, select_objects, select_one, select_related, \
+    select_reltuples, select_version
+from jsonapi.db.statement import cursor, estimate, fetch, fetchrow, fetchval, session, transaction
+from jsonapi.db.table import Cardinality, FromClause, FromItem, OrderBy, RowLevelSecurity, get_primary_key, \
+    is_from_item
+from jsonapi.exc import APIError, Error, Forbidden, ModelError, NotFound, NotModified, LargeResult
+from jsonapi.fields import Aggregate, BaseField, Field, Relationship, get_linkage
 from jsonapi.log import log_query, logger
 from jsonapi.registry import model_registry, schema_registry
+from jsonapi.serializer import SERIALIZERS, CompiledSchema, ResourceEncoder, encode_document
 from jsonapi.util import v
 
 MIME_TYPE = 'application/vnd.api+json'
@@ -34,6 +44,126 @@ RESULT_SIZE = 300
 The default limit for the size of the primary data  of the response document
 """
 
+STREAM_BATCH_SIZE = 100
+"""
+The number of rows read from the cursor, and the number of resource objects encoded, per chunk of a streamed
+response document (see :meth:`Model.stream_collection`)
+"""
+
+DEFERRED_OFFSET = 1000
+"""
+The page offset from which the primary keys of a page of objects are selected first, and the rest of the fields
+(including aggregate fields) are selected for the objects of the page only
+"""
+
+CONCURRENCY = 1
+"""
+The maximum number of relationship queries run concurrently while fetching included resources, each on its own
+pool connection (1 runs them in sequence)
+"""
+
+SERIALIZER = 'marshmallow'
+"""
+The default serializer engine: "marshmallow" or "compiled" (see :mod:`jsonapi.serializer`)
+"""
+
+SCHEMA_CACHE_SIZE = 512
+"""
+The maximum number of compiled schemas kept in :data:`schema_cache`
+"""
+
+schema_cache = LRUCache(SCHEMA_CACHE_SIZE)
+"""
+Compiled schemas keyed by model name, include path and request shape (see :meth:`RequestArguments.shape`)
+"""
+
+RESOURCE_CACHE_SIZE = 10000
+"""
+The maximum number of records kept in :data:`resource_cache`
+"""
+
+RESOURCE_CACHE_BYTES = 64 * 2 ** 20
+"""
+The (approximate) maximum size of the records kept in :data:`resource_cache`, in bytes
+"""
+
+RESOURCE_CACHE_TTL = 300
+"""
+The maximum age of a record kept in :data:`resource_cache`, in seconds
+"""
+
+resource_cache = ResourceCache(RESOURCE_CACHE_SIZE, RESOURCE_CACHE_BYTES, RESOURCE_CACHE_TTL)
+"""
+Records of cached models (see :attr:`Model.cache`) keyed by type, fieldset and id, invalidated by table
+(see :mod:`jsonapi.db.notify`)
+"""
+
+COUNT_MODES = ('exact', 'window', 'estimate', 'none')
+"""
+The supported values of the "option[count]" parameter: count the total number of objects with a separate query
+("exact", the default) or with a window function in the query selecting the page ("window"), use the query planner's
+estimate ("estimate"), or skip counting and check if there is a next page ("none")
+"""
+
+RESPONSE_CACHE_SIZE = 1000
+"""
+The maximum number of response documents kept in :data:`response_cache`
+"""
+
+RESPONSE_CACHE_BYTES = 64 * 2 ** 20
+"""
+The (approximate) maximum size of the response documents kept in :data:`response_cache`, in bytes
+"""
+
+RESPONSE_CACHE_TTL = 60
+"""
+The maximum age of a response document kept in :data:`response_cache`, in seconds
+"""
+
+response_cache = ResourceCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_BYTES, RESPONSE_CACHE_TTL)
+"""
+Encoded response documents and their entity tags (see :meth:`Model.get_cached`) keyed by model, method, request
+arguments and user, invalidated by table (see :mod:`jsonapi.db.notify`)
+"""
+
+ACCESS_CACHE_SIZE = 10000
+"""
+The maximum number of (model, user) entries kept in :data:`access_cache`
+"""
+
+ACCESS_CACHE_BYTES = 16 * 2 ** 20
+"""
+The (approximate) maximum size of the object ids kept in :data:`access_cache`, in bytes
+"""
+
+ACCESS_CACHE_TTL = 60
+"""
+The maximum age of an entry kept in :data:`access_cache`, in seconds
+"""
+
+ACCESS_GRANTS_LIMIT = 1000
+"""
+The maximum number of object ids kept in :data:`access_cache` per model and user, and sent with each protected query
+(the access function is called for the other objects)
+"""
+
+access_cache = ResourceCache(ACCESS_CACHE_SIZE, ACCESS_CACHE_BYTES, ACCESS_CACHE_TTL)
+"""
+The ids of the objects of protected models the user is known to have access to (see :attr:`Model.cache_access`), keyed
+by model name, type and user id, invalidated by table (see :attr:`Model.access_tables`)
+"""
+
+MODEL_CACHE_SIZE = 512
+"""
+The maximum number of configured models kept in :data:`model_cache`
+"""
+
+model_cache = LRUCache(MODEL_CACHE_SIZE)
+"""
+Configured models keyed by model name, relationship name, serializer engine and request shape
+(see :meth:`Model.configure`)
+"""
+
 ONE_TO_ONE = Cardinality.ONE_TO_ONE
 MANY_TO_ONE = Cardinality.MANY_TO_ONE
 ONE_TO_MANY = Cardinality.ONE_TO_MANY
@@ -48,15 +178,114 @@ def get_error_object(e):
     raise e
 
 
-def _update_included_rec(a, b):
-    for key in b:
-        if key not in a:
-            a[key] = b[key]
-    return a
+def _encode(obj):
+    return json.dumps(obj, separators=(',', ':'), default=str).encode()
+
+
+def _encode_list(resources):
+    return b','.join(_encode(resource) for resource in resources)
+
+
+def _get_models(model):
+    yield model
+    for field in model.fields.values():
+        if isinstance(field, Relationship) and field.model is not None:
+            yield from _get_models(field.model)
+
+
+def _hashable(value):
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
+
+
+def _etag_matches(etag, if_none_match):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+def _get_settings(args):
+    """
+    Get the row-level security settings of the models passed to a fetch method (or function), and of all the models
+    they are related to: the id of the current user, keyed by setting name (see :class:`RowLevelSecurity`).
+    """
+    settings = dict()
+    seen = set()
+    classes = [type(arg) if isinstance(arg, Model) else arg for arg in args
+               if isinstance(arg, Model) or (isinstance(arg, type) and issubclass(arg, Model))]
+    while classes:
+        cls = classes.pop()
+        if cls in seen:
+            continue
+        seen.add(cls)
+        if isinstance(cls.access, RowLevelSecurity):
+            settings[cls.access.setting] = str(cls.user.id) if cls.user else ''
+        if cls.fields is not None:
+            classes.extend(model_registry[field.model_name] for field in v(cls.fields)
+                           if isinstance(field, Relationship))
+    return settings
+
+
+def _row_security(func):
+    """
+    Run a fetch method (or function) in a database session (see :func:`jsonapi.db.statement.session`) if any of
+    the models involved is protected by row-level security policies.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with session(_get_settings(args)):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def _flatten(included):
+    return [resource for resources in included.values() for resource in resources.values()]
+
+
+def _share_context(schema, context):
+    schema.context = context
+    for field in schema.fields.values():
+        if isinstance(field, ma.fields.Nested):
+            _share_context(field.schema, context)
+    return schema
+
+
+class RequestContext:
+    """
+    The state of a single request: parsed arguments, included resources and meta data.
+
+    Configured models are shared between requests, so anything produced while serving a request is kept here.
+    """
+
+    def __init__(self, args=None, concurrency=1, current=None):
+        self.args = args
+        self.session = current
+        self.included = defaultdict(dict)
+        self.meta = dict()
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        embed = args.options.get('embed', None) if args else None
+        self.embed = tuple(AttributePath(path).names for path in embed.split(',')) if embed else ()
+
+    def embeds(self, name, parents=()):
+        """
+        Check if a relationship is embedded in the primary query ("option[embed]").
+
+        The option value is a comma separated list of include paths, or "*" for all included relationships.
+        A path embeds each relationship along the path.
+        """
+        path = (*parents, name)
+        return any(names == ('*',) or names[:len(path)] == path for names in self.embed)
+
+    def __repr__(self):
+        return '<{}({!r})>'.format(self.__class__.__name__, self.args)
 
 
 class JSONSchema(ma.Schema):
 
+    class Meta:
+        ordered = True
+
     @ma.post_dump(pass_many=False, pass_original=True)
     def wrap(self, data, orig, many):
 
@@ -74,23 +303,7 @@ class JSONSchema(ma.Schema):
             elif isinstance(field, ma.fields.Nested) and not field.load_only:
                 if 'relationships' not in resource:
                     resource['relationships'] = dict()
-                included = self.context['root'].included
-                if isinstance(data[name], list):
-                    resource['relationships'][name] = [dict(id=rec['id'], type=rec['type']) for rec in data[name]]
-                    if len(data[name]) > 0:
-                        for rec in data[name]:
-                            if rec['type'] in included and rec['id'] in included[rec['type']]:
-                                rec = _update_included_rec(rec, included[rec['type']][rec['id']])
-                            included[rec['type']][rec['id']] = rec
-                else:
-                    if data[name] is None:
-                        resource['relationships'][name] = None
-                    else:
-                        resource['relationships'][name] = dict(id=data[name]['id'], type=orig[name]['type'])
-                        if orig[name]['type'] in included and data[name]['id'] in included[orig[name]['type']]:
-                            data[name] = _update_included_rec(data[name],
-                                                              included[orig[name]['type']][data[name]['id']])
-                        included[orig[name]['type']][data[name]['id']] = data[name]
+                resource['relationships'][name] = get_linkage(data[name])
         return resource
 
 
@@ -116,7 +329,8 @@ class Model:
 
     access = None
     """
-    An SQL function providing object-level access protection.
+    An SQL function providing object-level access protection, an :class:`AccessSet <jsonapi.db.table.AccessSet>`, or
+    :class:`RowLevelSecurity <jsonapi.db.table.RowLevelSecurity>`.
     """
 
     user = None
@@ -124,11 +338,45 @@ class Model:
     A thread-safe object representing a logged-in user.
     """
 
+    access_tables = ()
+    """
+    The tables the access decisions of a protected model depend on, in addition to the tables of the model (for
+    example, an access control table). Changes to these tables invalidate :data:`access_cache`.
+    """
+
+    cache_access = False
+    """
+    Keep the access decisions of this protected model in :data:`access_cache`, across requests (see
+    :meth:`get_grants`). Revoked access is only noticed once the cache is invalidated (see :mod:`jsonapi.db.notify`)
+    or the decisions expire.
+    """
+
     search = None
     """
     A full-text index table.
     """
 
+    serializer = None
+    """
+    The serializer engine ("marshmallow" or "compiled"), overrides :data:`SERIALIZER` if set.
+    """
+
+    concurrency = None
+    """
+    The maximum number of concurrent relationship queries per request, overrides :data:`CONCURRENCY` if set.
+    """
+
+    cache = False
+    """
+    Keep the records of this model in :data:`resource_cache`, across requests. Protected models are not cached.
+    """
+
+    version = None
+    """
+    The name of a column holding the version of a row (for example, an "updated_on" timestamp), used to compute
+    entity tags (see :meth:`get_validator`). By default, the transaction ids of the table rows (``xmin``) are used.
+    """
+
     ####################################################################################################################
     # initialization
     ####################################################################################################################
@@ -148,8 +396,9 @@ class Model:
             raise ModelError(e, self)
 
         self.schema = None
-        self.included = defaultdict(dict)
-        self.meta = dict()
+        self.schema_key = None
+        self.encoder = None
+        self.tables = None
         logger.info('initialized model: {!r}'.format(self))
 
     @classmethod
@@ -269,7 +518,63 @@ class Model:
     # core functionality
     ####################################################################################################################
 
+    def configure(self, args=None, relationship_name=None):
+        """
+        Get a copy of the model initialized for the request arguments (see :meth:`init_schema`).
+
+        Configured models are cached by request shape and serializer engine, and are not modified after
+        initialization, so a single instance can serve any number of concurrent requests. Request state is kept in
+        a :class:`RequestContext`.
+
+        :param RequestArguments args: parsed request arguments
+        :param str relationship_name: initialize the related model of this relationship for the arguments instead
+        :return: a configured model
+        """
+        serializers = [self.get_serializer()]
+        if relationship_name is not None:
+            related = model_registry[self.relationship(relationship_name).model_name]
+            serializers.append(related.serializer if related.serializer is not None else SERIALIZER)
+        key = (self.name, relationship_name, tuple(serializers), args.shape() if args else None)
+        model = model_cache.get(key)
+        if model is None:
+            model = self.clone()
+            if relationship_name is None:
+                model.init_schema(args)
+            else:
+                model.init_schema()
+                rel = model.relationship(relationship_name)
+                rel.load(model)
+                rel.model.init_schema(args)
+            model_cache[key] = model
+        return model
+
+    def clone(self):
+        model = copy(self)
+        model.fields = {name: copy(field) for name, field in self.fields.items()}
+        for field in model.fields.values():
+            if isinstance(field, Relationship):
+                field.model = None
+                field.parent = None
+            elif isinstance(field, Aggregate):
+                field.expr = None
+                field.rel = None
+                field.from_items = dict()
+        model.schema = None
+        model.schema_key = None
+        model.encoder = None
+        return model
+
     def init_schema(self, args=None, parents=()):
+        """
+        Load the fields of the model for the request arguments, and set its schema. Compiled schemas are kept in
+        :data:`schema_cache`, and a model initialized for the same request shape already is returned as is, without
+        loading its fields again (request handlers get initialized models from :data:`model_cache` instead, see
+        :meth:`configure`).
+        """
+        serializer = self.get_serializer() if not parents else 'marshmallow'
+        key = (self.name, parents, serializer, args.shape() if args else None)
+        if self.schema is not None and self.schema_key == key:
+            return
 
         for name, field in self.fields.items():
 
@@ -303,27 +608,110 @@ class Model:
             else:
                 raise ModelError('unsupported field: {!r}'.format(field), self)
 
+        schema = schema_cache.get(key)
+        if schema is None:
+            schema = self.get_schema(serializer)
+            schema_cache[key] = schema
+        if isinstance(schema, JSONSchema):
+            schema_registry[schema.__class__.__name__] = schema.__class__
+        self.schema = schema
+        self.schema_key = key
+        self.encoder = None
+
+    def get_serializer(self):
+        serializer = self.serializer if self.serializer is not None else SERIALIZER
+        if serializer not in SERIALIZERS:
+            raise ModelError('invalid serializer: {!r}'.format(serializer), self)
+        return serializer
+
+    def get_cache(self):
+        """
+        Get the cache of the records of this model: :data:`resource_cache`, or ``None`` (see :attr:`cache`).
+        """
+        return resource_cache if self.cache and self.access is None else None
+
+    def cache_key(self, object_id):
+        return self.type_, tuple(self.attributes.keys()), str(object_id)
+
+    def cache_record(self, rec):
+        """
+        Add a copy of a record to :data:`resource_cache`, along with the names of the tables it depends on.
+        """
+        if self.tables is None:
+            self.tables = tuple(get_tables(self))
+        resource_cache.set(self.cache_key(rec['id']), dict(rec), self.tables)
+
+    def grants_key(self):
+        if not self.cache_access or self.access is None or isinstance(self.access, RowLevelSecurity) \
+                or not getattr(self, 'user', None):
+            return None
+        return self.name, self.type_, self.user.id
+
+    def get_grants(self):
+        """
+        Get the ids of the objects the current user is known to have access to, from :data:`access_cache`. Queries
+        check these ids with ``id = ANY(...)`` before calling the access function.
+
+        :return: a sorted list of at most :data:`ACCESS_GRANTS_LIMIT` ids, or ``None``
+        """
+        key = self.grants_key()
+        grants = access_cache.get(key) if key is not None else None
+        return list(grants) if grants else None
+
+    def grant(self, recs):
+        """
+        Add the ids of records the current user has access to (records returned by protected queries) to
+        :data:`access_cache`, up to :data:`ACCESS_GRANTS_LIMIT` ids.
+        """
+        key = self.grants_key()
+        if key is None or not recs:
+            return
+        grants = access_cache.get(key) or ()
+        if len(grants) >= ACCESS_GRANTS_LIMIT:
+            return
+        ids = sorted(set(rec['id'] for rec in recs).difference(grants))[:ACCESS_GRANTS_LIMIT - len(grants)]
+        if ids:
+            if self.tables is None:
+                self.tables = tuple(get_tables(self))
+            access_cache.set(key, tuple(sorted(grants + tuple(ids))), self.tables)
+
+    def get_concurrency(self):
+        concurrency = self.concurrency if self.concurrency is not None else CONCURRENCY
+        if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+            raise ModelError('invalid concurrency: {!r}'.format(concurrency), self)
+        return concurrency
+
+    def get_schema(self, serializer='marshmallow'):
+        if serializer == 'compiled':
+            return CompiledSchema(self)
         schema = type('{}Schema'.format(self.name),
                       (JSONSchema,),
                       {name: field.get_ma_field() for name, field in self.fields.items() if not field.exclude})
-        schema_registry[schema.__name__] = schema
-        self.schema = schema()
-        self.schema.context['root'] = self
-
-    def response(self, data):
-        response = dict(data=self.schema.dump(data, many=isinstance(data, list)))
-        if len(self.included) > 0:
-            response['included'] = reduce(lambda a, b: a + [rec for rec in b.values()], self.included.values(), list())
-        if len(self.meta) > 0:
-            response['meta'] = dict(self.meta)
-        self.reset()
+        return _share_context(schema(), dict())
+
+    def dump(self, context, data):
+        self.schema.context['root'] = context
+        return self.schema.dump(data, many=isinstance(data, list))
+
+    def response(self, context, data, encode=False):
+        if encode:
+            return self.response_bytes(context, data)
+        response = dict(data=self.dump(context, data))
+        if len(context.included) > 0:
+            response['included'] = _flatten(context.included)
+        if len(context.meta) > 0:
+            response['meta'] = dict(context.meta)
         return response
 
-    def reset(self):
-        self.included.clear()
-        self.meta = dict()
+    def response_bytes(self, context, data):
+        """
+        Encode the response document straight from the records (see :func:`jsonapi.serializer.encode_document`).
+        """
+        if self.encoder is None:
+            self.encoder = ResourceEncoder(self)
+        return encode_document(self.encoder, data, context.meta)
 
-    async def set_meta(self, limit, object_id=None, rel=None, **kwargs):
+    async def set_meta(self, context, limit, object_id=None, rel=None, **kwargs):
 
         where = kwargs.pop('where', None)
         filter_by = kwargs.pop('filter_by', None)
@@ -332,37 +720,181 @@ class Model:
         options = kwargs.pop('options', None)
         is_merged = kwargs.pop('merge', False)
         is_related = object_id is not None and rel is not None and not is_merged
-        if limit is not None or search_term is not None or filter_by:
+        mode = self.count_mode(context)
 
+        def select(**select_args):
             if is_merged:
-                query = select_merged(rel.parent, rel, object_id, exclude=exclude, options=options, count=True)
-            elif is_related:
-                query = select_related(rel, object_id, where=where, count=True)
-            else:
-                query = select_many(self, where=where, count=True)
-            self.meta['total'] = await pg.fetchval(query)
+                return select_merged(rel.parent, rel, object_id, exclude=exclude, options=options, **select_args)
+            if is_related:
+                return select_related(rel, object_id, **select_args)
+            return select_many(self, **select_args)
+
+        if search_term is not None:
+            context.meta['searchTerm'] = search_term
+        if mode == 'none' or not (limit is not None or search_term is not None or filter_by):
+            return
 
+        if mode == 'estimate':
+            total = -1
+            if where is None and object_id is None and self.access is None:
+                total = await fetchval(select_reltuples(self), context.session)
+            context.meta['total'] = int(total) if total is not None and total >= 0 \
+                else await estimate(select(where=where), context.session)
             if limit is not None and filter_by:
-                if is_merged:
-                    query = select_merged(rel.parent, rel, object_id, exclude=exclude, options=options,
-                                          filter_by=filter_by, count=True)
-                elif is_related:
-                    query = select_related(rel, object_id, where=where, filter_by=filter_by, count=True)
-                else:
-                    query = select_many(self, where=where, filter_by=filter_by, count=True)
-                self.meta['totalFiltered'] = await pg.fetchval(query)
-
-            if search_term is not None:
-                self.meta['searchTerm'] = search_term
-                if limit is not None:
-                    if is_merged:
-                        query = select_merged(rel.parent, rel, object_id, exclude=exclude, options=options,
-                                              search_term=search_term, count=True)
-                    elif is_related:
-                        query = select_related(rel, object_id, search_term=search_term, count=True)
-                    else:
-                        query = select_many(self, search_term=search_term, count=True)
-                    self.meta['searchTotal'] = await pg.fetchval(query)
+                context.meta['totalFiltered'] = await estimate(select(where=where, filter_by=filter_by),
+                                                               context.session)
+            if limit is not None and search_term is not None:
+                context.meta['searchTotal'] = await estimate(select(search_term=search_term), context.session)
+            context.meta['estimate'] = True
+            return
+
+        counts = dict(filter_by=filter_by, search_term=search_term) if limit is not None else dict()
+        totals = await fetchrow(select(where=where, totals=True, **counts), context.session)
+        context.meta['total'] = totals['total']
+        if limit is not None and filter_by:
+            context.meta['totalFiltered'] = totals['filtered']
+        if limit is not None and search_term is not None:
+            context.meta['searchTotal'] = totals['search']
+
+    def count_mode(self, context):
+        """
+        Get the counting mode of a request ("option[count]", see :data:`COUNT_MODES`).
+        """
+        mode = context.args.options.get('count', COUNT_MODES[0])
+        if mode not in COUNT_MODES:
+            raise APIError('invalid count option: {!r}'.format(mode), self)
+        return mode
+
+    def count_window(self, context, filter_by=None, search_term=None):
+        """
+        Check if the total number of objects is selected with the page of objects ("option[count]=window").
+
+        The window function counts the objects selected, so it is used for unfiltered requests only, without
+        a page cursor.
+        """
+        return self.count_mode(context) == 'window' and context.args.page.limit is not None \
+            and context.args.page.cursor is None and not filter_by and search_term is None
+
+    def set_window_meta(self, context, recs):
+        """
+        Set the total number of objects selected with the page of objects (see :meth:`count_window`).
+
+        :return: ``False`` if the page is empty, and the total must be counted separately
+        """
+        if not recs:
+            return False
+        context.meta['total'] = recs[0][WINDOW_LABEL]
+        for rec in recs:
+            del rec[WINDOW_LABEL]
+        return True
+
+    def get_page_limit(self, context):
+        """
+        Get the number of objects to select for a page: one more than the page size, to check if there is
+        a next page, when counting is skipped ("option[count]=none").
+        """
+        limit = context.args.page.limit
+        return limit + 1 if limit is not None and self.count_mode(context) == 'none' else limit
+
+    def set_next_meta(self, context, recs, count=None):
+        """
+        Set the "hasNext" flag, if counting is skipped (see :meth:`get_page_limit`).
+
+        :param RequestContext context: request context
+        :param list recs: the objects selected, or the last batch of them (see :meth:`stream_collection`)
+        :param int count: the number of objects read so far, if ``recs`` is a batch
+        :return: the page of objects, without the extra object selected
+        """
+        limit = context.args.page.limit
+        if limit is None or self.count_mode(context) != 'none':
+            return recs
+        count = len(recs) if count is None else count
+        context.meta['hasNext'] = count > limit
+        return recs[:len(recs) - (count - limit)] if count > limit else recs
+
+    def get_keyset(self, context, order_by, search_term=None):
+        """
+        Get the keyset pagination arguments of a request ("page[after]" or "page[before]").
+
+        :return: ``None``, or a pair of the direction ("after" or "before") and the sort key values of the page
+                 cursor (``None`` for the first or the last page)
+        """
+        cursor = context.args.page.cursor
+        if cursor is None:
+            return None
+        if search_term is not None and not order_by:
+            raise APIError('page cursor | sort order required when searching', self)
+        fields = [field for _, _, field in order_by.keys]
+        if any(field.is_aggregate() for field in fields):
+            raise APIError('page cursor | sorting by aggregate fields is not supported', self)
+        direction, values = cursor
+        if values is None:
+            return cursor
+        fields.append(self.fields['id'])
+        if len(values) != len(fields):
+            raise APIError('invalid page cursor', self)
+        try:
+            return direction, [None if value is None else self._load_key(field, value)
+                               for field, value in zip(fields, values)]
+        except (ValueError, TypeError, ArithmeticError):
+            raise APIError('invalid page cursor', self)
+
+    @staticmethod
+    def _load_key(field, value):
+        data_type = field.data_type
+        if data_type is Float and isinstance(value, str):
+            return Decimal(value)
+        if data_type is not None and data_type.json_parser is not None and isinstance(value, str):
+            return data_type.json_parser(value)
+        return value
+
+    def set_cursor_meta(self, context, order_by, recs):
+        """
+        Set the page cursors of a keyset paginated request (see :meth:`get_keyset`): "after" the last object and
+        "before" the first object of the page.
+
+        :return: the page of objects, in sort order
+        """
+        cursor = context.args.page.cursor
+        if cursor is None:
+            return recs
+        if cursor[0] == 'before':
+            recs.reverse()
+        names = ['{}_{:d}'.format(KEY_LABEL, i) for i in range(len(order_by.keys))]
+        if recs:
+            context.meta['cursor'] = dict(
+                before=encode_cursor([*(recs[0][name] for name in names), recs[0]['id']]),
+                after=encode_cursor([*(recs[-1][name] for name in names), recs[-1]['id']]))
+        for rec in recs:
+            for name in names:
+                del rec[name]
+        return recs
+
+    def get_embedded(self, context, parents=()):
+        """
+        Get the included relationships embedded in the primary query, as (relationship, nested) pairs.
+        """
+        return tuple((rel, rel.model.get_embedded(context, (*parents, name)))
+                     for name, rel in self.relationships.items() if context.embeds(name, parents))
+
+    def load_embedded(self, value):
+        """
+        Load the records embedded in the primary query as a JSON array.
+
+        :param value: a JSON array (as a string or decoded) or ``None``
+        :return: a list of records, with values converted to the field data types
+        """
+        if isinstance(value, str):
+            value = json.loads(value, parse_float=Decimal)
+        recs = list()
+        for rec in value or ():
+            for name, val in rec.items():
+                if val is not None and name in self.fields and not isinstance(self.fields[name], Relationship):
+                    data_type = self.fields[name].data_type
+                    if data_type is not None and data_type.json_parser is not None:
+                        rec[name] = data_type.json_parser(val)
+            recs.append(rec)
+        return recs
 
     def get_filter_by(self, args):
         filter_by = FilterBy()
@@ -373,15 +905,51 @@ class Model:
     def get_order_by(self, args):
         return OrderBy(self, *args.sort)
 
-    def check_size(self, args, recs):
-        if 'limit' in args.options:
-            n = self.meta['totalFiltered'] if 'totalFiltered' in self.meta else len(recs)
+    def check_size(self, context, recs):
+        if 'limit' in context.args.options:
+            n = context.meta['totalFiltered'] if 'totalFiltered' in context.meta else len(recs)
             if n > RESULT_SIZE:
                 raise LargeResult('primary data size: {!r} '
                                   'exceeded the limit: {!r}'.format(n, RESULT_SIZE),
                                   self, n, RESULT_SIZE)
 
-    async def fetch_included(self, data, args):
+    async def fetch_object(self, object_id, embed=()):
+        """
+        Fetch a single record in one round trip.
+
+        The access check is selected as a column rather than applied as a filter, so a missing object and
+        an object the user can not access can be told apart. Records of cached models (see :attr:`cache`) are read from
+        :data:`resource_cache` first.
+        """
+        cache = self.get_cache() if not embed and not isinstance(object_id, dict) else None
+        if cache is not None:
+            rec = cache.get(self.cache_key(object_id))
+            if rec is not None:
+                return dict(rec)
+        query = select_one(self, object_id, embed)
+        log_query(query)
+        rec = await fetchrow(query)
+        if rec is None:
+            raise NotFound(object_id, self)
+        rec = dict(rec)
+        if not rec.pop(ACCESS_LABEL, True):
+            raise Forbidden(object_id, self)
+        self.grant([rec])
+        if cache is not None:
+            self.cache_record(rec)
+        return rec
+
+    async def fetch_included(self, context, data, embed=()):
+        """
+        Fetch included resources, one level of the include tree at a time.
+
+        At each level, relationships to the same model are fetched together: the resource linkage of every
+        relationship is selected first, then each related object is fetched once, no matter how many parents or
+        include paths refer to it. Objects fetched at an earlier level are not fetched again, and the record of an
+        object is shared by all of its parents, and serialized once (see :class:`jsonapi.fields.Included`).
+
+        Relationships embedded in the primary query (see :meth:`get_embedded`) are read from the records.
+        """
 
         if not isinstance(data, list):
             data = list() if data is None else [data]
@@ -389,34 +957,108 @@ class Model:
         for rec in data:
             rec['type'] = self.type_
 
-        for rel in self.relationships.values():
-            result = list()
-            for query in select_related(rel, list(set(rec['id'] for rec in data))):
-                log_query(query)
-                result.extend(await pg.fetch(query))
+        objects = defaultdict(dict)
+        level = [(self, data, embed)]
+        while level:
+            groups = defaultdict(list)
+            results = [list()]
+            for model, parents, embedded in level:
+                embedded = dict((rel.name, nested) for rel, nested in embedded)
+                if parents:
+                    for rel in model.relationships.values():
+                        if rel.name in embedded:
+                            results[0].append((rel, parents, {
+                                parent['id']: rel.model.load_embedded(parent[rel.name]) for parent in parents
+                            }, embedded[rel.name]))
+                        else:
+                            groups[rel.model_name].append((rel, parents))
+
+            if context.concurrency > 1:
+                results.extend(await asyncio.gather(*(self.fetch_relationships(context, objects, group)
+                                                      for group in groups.values())))
+            else:
+                results.extend([await self.fetch_relationships(context, objects, group)
+                                for group in groups.values()])
+
+            level = list()
+            for rel, parents, recs_by_parent_id, nested in (result for group in results for result in group):
+                children = dict()
+                for parent in parents:
+                    recs = recs_by_parent_id[parent['id']] if parent['id'] in recs_by_parent_id else list()
+                    if rel.cardinality in (Cardinality.ONE_TO_ONE, Cardinality.MANY_TO_ONE):
+                        recs = recs[:1]
+                        parent[rel.name] = recs[0] if recs else None
+                    else:
+                        parent[rel.name] = recs
+                    for rec in recs:
+                        rec['type'] = rel.model.type_
+                        children[id(rec)] = rec
+                level.append((rel.model, list(children.values()), nested))
+
+    async def fetch_relationships(self, context, objects, group):
+        """
+        Fetch the related records of one or more relationships to the same model.
+
+        Records of cached models (see :attr:`cache`) are read from :data:`resource_cache` first, after the resource
+        linkage is selected.
 
+        :param RequestContext context: request context
+        :param dict objects: records fetched so far, keyed by model name and id
+        :param list group: a list of (relationship, parent records) pairs
+        :return: a list of (relationship, parent records, related records keyed by parent id, ()) tuples
+        """
+        rel, parents = group[0]
+        fetched = objects[rel.model_name]
+        cache = rel.model.get_cache()
+        if len(group) == 1 and not fetched and cache is None:
             recs_by_parent_id = defaultdict(list)
+            query = select_related(rel, list(set(rec['id'] for rec in parents)))
+            log_query(query)
+            async with context.semaphore:
+                result = await fetch(query, context.session)
+            rel.model.grant(result)
             for rec in result:
                 rec = dict(rec)
                 parent_id = rec.pop('parent_id')
-                recs_by_parent_id[parent_id].append(rec)
+                recs_by_parent_id[parent_id].append(fetched.setdefault(rec['id'], rec))
+            return [(rel, parents, recs_by_parent_id, ())]
 
-            for parent in data:
-                parent_id = parent['id']
-                if rel.cardinality in (Cardinality.ONE_TO_ONE, Cardinality.MANY_TO_ONE):
-                    parent[rel.name] = recs_by_parent_id[parent_id][0] if parent_id in recs_by_parent_id else None
-                else:
-                    parent[rel.name] = recs_by_parent_id[parent_id] if parent_id in recs_by_parent_id else list()
+        query = select_linkage([(rel, list(set(rec['id'] for rec in parents))) for rel, parents in group])
+        log_query(query)
+        async with context.semaphore:
+            links = await fetch(query, context.session)
+
+        object_ids = set(link['id'] for link in links) - fetched.keys()
+        if cache is not None:
+            for object_id in list(object_ids):
+                rec = cache.get(rel.model.cache_key(object_id))
+                if rec is not None:
+                    fetched[object_id] = dict(rec)
+                    object_ids.discard(object_id)
+
+        if object_ids:
+            query = select_objects(rel.model, list(object_ids))
+            log_query(query)
+            async with context.semaphore:
+                result = await fetch(query, context.session)
+            rel.model.grant(result)
+            for rec in result:
+                fetched[rec['id']] = dict(rec)
+                if cache is not None:
+                    rel.model.cache_record(rec)
 
-            await rel.model.fetch_included(
-                reduce(lambda a, b: a + b if isinstance(b, list) else a + [b],
-                       [rec[rel.name] for rec in data if rec[rel.name] is not None], list()), args)
+        recs_by_parent_id = [defaultdict(list) for _ in group]
+        for link in links:
+            if link['id'] in fetched:
+                recs_by_parent_id[link['rel']][link['parent_id']].append(fetched[link['id']])
+        return [(rel, parents, recs_by_parent_id[i], ()) for i, (rel, parents) in enumerate(group)]
 
     ####################################################################################################################
     # public interface
     ####################################################################################################################
 
-    async def get_object(self, args, object_id):
+    @_row_security
+    async def get_object(self, args, object_id, **kwargs):
         """
         Fetch a resource object.
 
@@ -438,23 +1080,19 @@ class Model:
 
         :param dict args: a dictionary representing the request query string
         :param int|str|dict object_id: the resource object id
+        :param bool encode: return the response document encoded as ``bytes`` (see :meth:`response_bytes`)
         :return: JSON API response document
         """
         args = self.parse_arguments(args)
-        self.init_schema(args)
+        model = self.configure(args)
+        context = RequestContext(args, model.get_concurrency())
 
-        if not await pg.fetchval(exists(self, object_id)):
-            raise NotFound(object_id, self)
-
-        query = select_one(self, object_id)
-        log_query(query)
-        result = await pg.fetchrow(query)
-        if result is None:
-            raise Forbidden(object_id, self)
-        rec = dict(result)
-        await self.fetch_included([rec], args)
-        return self.response(rec)
+        embed = model.get_embedded(context)
+        rec = await model.fetch_object(object_id, embed)
+        await model.fetch_included(context, [rec], embed)
+        return model.response(context, rec, kwargs.get('encode', False))
 
+    @_row_security
     async def get_collection(self, args, **kwargs):
         """
         Fetch a collection of resources.
@@ -479,26 +1117,160 @@ class Model:
 
         :param dict args: a dictionary representing the request query string
         :param str search: an optional search term
+        :param bool encode: return the response document encoded as ``bytes`` (see :meth:`response_bytes`)
         :return: JSON API response document
         """
         search_term = kwargs.pop('search', None) or args.pop('search', None)
         args = self.parse_arguments(args)
-        self.init_schema(args)
-        filter_by, order_by = self.get_filter_by(args), self.get_order_by(args)
+        model = self.configure(args)
+        context = RequestContext(args, model.get_concurrency())
+        filter_by, order_by = model.get_filter_by(args), model.get_order_by(args)
         where = None
         if 'where' in kwargs:
-            where = kwargs['where'](self.rec)
-        query = select_many(self, filter_by=filter_by, order_by=order_by,
-                            offset=args.page.offset, limit=args.page.limit,
-                            search_term=search_term, where=where)
+            where = kwargs['where'](model.rec)
+        embed = model.get_embedded(context)
+        window = model.count_window(context, filter_by, search_term)
+        keyset = model.get_keyset(context, order_by, search_term)
+        query = select_many(model, filter_by=filter_by, order_by=order_by,
+                            offset=args.page.offset, limit=model.get_page_limit(context),
+                            search_term=search_term, where=where, embed=embed, window=window, keyset=keyset,
+                            deferred=args.page.offset >= DEFERRED_OFFSET)
         log_query(query)
-        recs = {rec['id']: dict(rec) for rec in await pg.fetch(query)}
-        recs = list(recs.values())
-        await self.set_meta(args.page.limit, filter_by=filter_by, search_term=search_term, where=where)
-        self.check_size(args, recs)
-        await self.fetch_included(recs, args)
-        return self.response(recs)
+        recs = {rec['id']: dict(rec) for rec in await fetch(query)}
+        recs = model.set_cursor_meta(context, order_by, model.set_next_meta(context, list(recs.values())))
+        if not (window and model.set_window_meta(context, recs)):
+            await model.set_meta(context, args.page.limit, filter_by=filter_by, search_term=search_term, where=where)
+        model.check_size(context, recs)
+        model.grant(recs)
+        await model.fetch_included(context, recs, embed)
+        return model.response(context, recs, kwargs.get('encode', False))
+
+    async def stream_collection(self, args, **kwargs):
+        """
+        Fetch a collection of resources, as a JSON API response document encoded in chunks.
+
+        The primary data is read from a server-side cursor, :data:`STREAM_BATCH_SIZE` rows at a time, and each batch
+        of resource objects is encoded (along with their included resources) and sent before the next one is read.
+        The included resources and the meta section follow the primary data. The size of the primary data is not
+        limited (see ``option[limit]``).
+
+        All the queries run on the connection of the cursor, in a single read only transaction (see
+        :func:`jsonapi.db.statement.transaction`), so a stream holds one pool connection at a time.
+
+        >>> from jsonapi.tests.model import UserModel
+        >>> async for chunk in UserModel().stream_collection({'include': 'bio'}):
+        >>>     await response.write(chunk)
 
+        :param dict args: a dictionary representing the request query string
+        :param str search: an optional search term
+        :return: an asynchronous generator of ``bytes`` objects
+        """
+        search_term = kwargs.pop('search', None) or args.pop('search', None)
+        args = self.parse_arguments(args)
+        model = self.configure(args)
+        if args.page.cursor is not None:
+            raise APIError('stream_collection does not support page cursors', model)
+        filter_by, order_by = model.get_filter_by(args), model.get_order_by(args)
+        where = None
+        if 'where' in kwargs:
+            where = kwargs['where'](model.rec)
+        async with transaction(_get_settings((self,)), readonly=True, isolation='repeatable_read') as current:
+            context = RequestContext(args, model.get_concurrency(), current)
+            embed = model.get_embedded(context)
+            window = model.count_window(context, filter_by, search_term)
+            limit = model.get_page_limit(context)
+            query = select_many(model, filter_by=filter_by, order_by=order_by,
+                                offset=args.page.offset, limit=limit,
+                                search_term=search_term, where=where, embed=embed, window=window,
+                                deferred=args.page.offset >= DEFERRED_OFFSET)
+            log_query(query)
+
+            yield b'{"data":['
+            ids = set()
+            separator = b''
+            counted = False
+            async with cursor(query, STREAM_BATCH_SIZE, current) as rows:
+                batch = list()
+                async for row in rows:
+                    if row['id'] in ids:
+                        continue
+                    ids.add(row['id'])
+                    batch.append(dict(row))
+                    if len(batch) == STREAM_BATCH_SIZE:
+                        batch = model.set_next_meta(context, batch, len(ids))
+                        counted = window and model.set_window_meta(context, batch) or counted
+                        await model.fetch_included(context, batch, embed)
+                        yield separator + _encode_list(model.dump(context, batch))
+                        separator, batch = b',', list()
+                batch = model.set_next_meta(context, batch, len(ids))
+                counted = window and model.set_window_meta(context, batch) or counted
+                if batch:
+                    await model.fetch_included(context, batch, embed)
+                    yield separator + _encode_list(model.dump(context, batch))
+            yield b']'
+
+            if not counted:
+                await model.set_meta(context, args.page.limit, filter_by=filter_by, search_term=search_term,
+                                     where=where)
+        if context.included:
+            separator = b',"included":['
+            for resources in context.included.values():
+                resources = list(resources.values())
+                for i in range(0, len(resources), STREAM_BATCH_SIZE):
+                    yield separator + _encode_list(resources[i:i + STREAM_BATCH_SIZE])
+                    separator = b','
+            yield b']'
+        if context.meta:
+            yield b',"meta":' + _encode(context.meta)
+        yield b'}'
+
+    @_row_security
+    async def render_collection(self, args, **kwargs):
+        """
+        Fetch a collection of resources, as a JSON API response document rendered by the database.
+
+        Each resource object is built with ``json_build_object`` in the query selecting the page, and the JSON
+        text is copied into the response document as is: records are not decoded or serialized. Relationships
+        are not rendered by the database, so requests with included resources are served by
+        :meth:`get_collection`.
+
+        >>> from jsonapi.tests.model import ArticleModel
+        >>> await ArticleModel().render_collection({'page[size]': '10'})
+        b'{"data":[{"id" : "1", "type" : "article", "attributes" : {"title" : ...}}, ...],"meta":{"total":1000}}'
+
+        :param dict args: a dictionary representing the request query string
+        :param str search: an optional search term
+        :return: JSON API response document, encoded as ``bytes``
+        """
+        if 'include' in args:
+            return await self.get_collection(args, encode=True, **kwargs)
+        search_term = kwargs.pop('search', None) or args.pop('search', None)
+        args = self.parse_arguments(args)
+        model = self.configure(args)
+        context = RequestContext(args, model.get_concurrency())
+        filter_by, order_by = model.get_filter_by(args), model.get_order_by(args)
+        where = None
+        if 'where' in kwargs:
+            where = kwargs['where'](model.rec)
+        window = model.count_window(context, filter_by, search_term)
+        keyset = model.get_keyset(context, order_by, search_term)
+        query = select_many(model, filter_by=filter_by, order_by=order_by,
+                            offset=args.page.offset, limit=model.get_page_limit(context),
+                            search_term=search_term, where=where, window=window, keyset=keyset,
+                            deferred=args.page.offset >= DEFERRED_OFFSET, render=True)
+        log_query(query)
+        recs = {rec['id']: dict(rec) for rec in await fetch(query)}
+        recs = model.set_cursor_meta(context, order_by, model.set_next_meta(context, list(recs.values())))
+        if not (window and model.set_window_meta(context, recs)):
+            await model.set_meta(context, args.page.limit, filter_by=filter_by, search_term=search_term, where=where)
+        model.check_size(context, recs)
+        model.grant(recs)
+        document = b'{"data":[' + ','.join(rec[RENDER_LABEL] for rec in recs).encode() + b']'
+        if context.meta:
+            document += b',"meta":' + _encode(context.meta)
+        return document + b'}'
+
+    @_row_security
     async def get_related(self, args, object_id, relationship_name, **kwargs):
         """
         Fetch a collection of related resources.
@@ -514,77 +1286,162 @@ class Model:
         :param int|str|dict object_id: the resource object id
         :param str relationship_name: relationship name
         :param str search: an optional search term
+        :param bool encode: return the response document encoded as ``bytes`` (see :meth:`response_bytes`)
         :return: JSON API response document
         """
 
-        self.init_schema()
-        if not await pg.fetchval(exists(self, object_id)):
-            raise NotFound(object_id, self)
-
-        rec = await pg.fetchrow(select_one(self, object_id))
-        if rec is None:
-            raise Forbidden(object_id, self)
-
         search_term = kwargs.pop('search', None) or args.pop('search', None)
-
-        rel = self.relationship(relationship_name)
         args = self.parse_arguments(args)
-        rel.load(self)
-        rel.model.init_schema(args)
+        model = self.configure(args, relationship_name)
+        context = RequestContext(args, model.get_concurrency())
+
+        rec = await model.fetch_object(object_id)
+        rel = model.relationship(relationship_name)
         filter_by, order_by = rel.model.get_filter_by(args), rel.model.get_order_by(args)
         where = None
         if 'where' in kwargs:
-            where = kwargs['where'](self.rec, rel.model.rec)
+            where = kwargs['where'](model.rec, rel.model.rec)
+        embed = rel.model.get_embedded(context)
+        is_many = rel.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY)
+        window = is_many and rel.model.count_window(context, filter_by, search_term)
+        keyset = rel.model.get_keyset(context, order_by, search_term) if is_many else None
         query = select_related(rel, rec['id'], filter_by=filter_by, order_by=order_by,
-                               offset=args.page.offset, limit=args.page.limit, search_term=search_term,
-                               where=where)
+                               offset=args.page.offset, limit=rel.model.get_page_limit(context),
+                               search_term=search_term, where=where, embed=embed, window=window, keyset=keyset,
+                               deferred=args.page.offset >= DEFERRED_OFFSET)
         log_query(query)
         if rel.cardinality in (Cardinality.ONE_TO_ONE, Cardinality.MANY_TO_ONE):
-            result = await pg.fetchrow(query)
+            result = await fetchrow(query)
             data = dict(result) if result is not None else None
+            rel.model.grant([data] if data is not None else [])
+        else:
+            data = {rec['id']: dict(rec) for rec in await fetch(query)}
+            data = rel.model.set_cursor_meta(context, order_by, rel.model.set_next_meta(context, list(data.values())))
+            if not (window and rel.model.set_window_meta(context, data)):
+                await rel.model.set_meta(context, args.page.limit, rec['id'], rel,
+                                         filter_by=filter_by, search_term=search_term, where=where)
+            rel.model.check_size(context, data)
+            rel.model.grant(data)
+        await rel.model.fetch_included(context, data, embed)
+        return rel.model.response(context, data, kwargs.get('encode', False))
+
+    @_row_security
+    async def get_validator(self, args, object_id=None, **kwargs):
+        """
+        Compute the entity tag of a :meth:`get_object` (if ``object_id`` is set) or :meth:`get_collection` response,
+        without fetching it.
+
+        A single aggregate query selects the number of objects and their highest version (see :attr:`version`),
+        so a matching "If-None-Match" request header is answered before any attribute data, aggregate field or
+        included resource is loaded. Only the primary data is checked: changes to included resources, or to
+        aggregate fields computed from other tables, do not change the entity tag.
+
+        >>> from jsonapi.tests.model import UserModel
+        >>> etag = await UserModel().get_validator({}, if_none_match=request.headers.get('If-None-Match'))
+        >>> document = await UserModel().get_collection({})
+
+        :param dict args: a dictionary representing the request query string
+        :param int|str|dict object_id: the resource object id (optional)
+        :param str search: an optional search term
+        :param str if_none_match: the value of the "If-None-Match" request header
+        :return: the entity tag
+        :raises NotModified: if the entity tag matches ``if_none_match``
+        """
+        args = dict(args)
+        search_term = kwargs.pop('search', None) or args.pop('search', None)
+        parsed = self.parse_arguments(args)
+        model = self.configure(parsed)
+        if object_id is None:
+            where = kwargs['where'](model.rec) if 'where' in kwargs else None
+            query = select_version(model, filter_by=model.get_filter_by(parsed), search_term=search_term, where=where)
         else:
-            data = {rec['id']: dict(rec) for rec in await pg.fetch(query)}
-            data = list(data.values())
-            await rel.model.set_meta(args.page.limit, rec['id'], rel,
-                                     filter_by=filter_by, search_term=search_term, where=where)
-            rel.model.check_size(args, data)
-        await rel.model.fetch_included(data, args)
-        return rel.model.response(data)
+            query = select_version(model, object_id)
+        log_query(query)
+        count, version = await fetchrow(query)
+        user_id = (model.user.id if model.user else None) if model.access is not None else None
+        key = (self.name, parsed.key(), _hashable(object_id), search_term, user_id, count, str(version))
+        etag = '"{}"'.format(hashlib.sha1(repr(key).encode()).hexdigest())
+        if _etag_matches(etag, kwargs.get('if_none_match', None)):
+            raise NotModified(etag, model)
+        return etag
+
+    async def get_cached(self, name, args, *method_args, **kwargs):
+        """
+        Fetch a response document through :data:`response_cache`.
 
+        Documents are cached by model, method, request arguments and, if any of the models involved is protected,
+        the logged-in user. A cached document is dropped when any of the tables of the models involved changes.
+
+        >>> from jsonapi.tests.model import UserModel
+        >>> document, etag = await UserModel().get_cached('get_related', {}, 1, 'articles',
+        >>>                                               if_none_match=request.headers.get('If-None-Match'))
+
+        :param str name: the name of the method: "get_object", "get_collection" or "get_related"
+        :param dict args: a dictionary representing the request query string
+        :param method_args: the object id and relationship name arguments of the method
+        :param str if_none_match: the value of the "If-None-Match" request header
+        :return: a tuple of the response document (encoded as ``bytes``) and its entity tag
+        :raises NotModified: if the entity tag of the response document matches ``if_none_match``
+        """
+        if name not in ('get_object', 'get_collection', 'get_related'):
+            raise ModelError('invalid method: {!r}'.format(name), self)
+        if 'where' in kwargs:
+            raise ModelError('get_cached does not support "where" clauses', self)
+        if_none_match = kwargs.pop('if_none_match', None)
+        parsed = self.parse_arguments(args)
+        model = self.configure(parsed, method_args[1] if name == 'get_related' else None)
+        models = list(_get_models(model))
+        protected = [m for m in models if m.access is not None]
+        user_id = (protected[0].user.id if protected[0].user else None) if protected else None
+        key = (self.name, name, parsed.key(), tuple(_hashable(arg) for arg in method_args),
+               tuple(sorted(kwargs.items())), bool(protected), user_id)
+        entry = response_cache.get(key)
+        if entry is None:
+            document = await getattr(self, name)(dict(args), *method_args, encode=True, **kwargs)
+            etag = '"{}"'.format(hashlib.sha1(document).hexdigest())
+            response_cache.set(key, (etag, document), set(table for m in models for table in get_tables(m)))
+        else:
+            etag, document = entry
+        if _etag_matches(etag, if_none_match):
+            raise NotModified(etag, model)
+        return document, etag
+
+    @_row_security
     async def get_merged(self, args, object_ids, relationship_name, **kwargs):
-        self.init_schema()
+        args = self.parse_arguments(args)
+        model = self.configure(args, relationship_name)
+        context = RequestContext(args, model.get_concurrency())
+        query = select_access(model, object_ids)
+        log_query(query)
+        recs = {rec['id']: rec for rec in await fetch(query)}
         for object_id in object_ids:
-            if not await pg.fetchval(exists(self, object_id)):
-                raise NotFound(object_id, self)
-
-        recs = list()
+            if object_id not in recs:
+                raise NotFound(object_id, model)
         for object_id in object_ids:
-            rec = await pg.fetchrow(select_one(self, object_id))
-            if rec is None:
-                raise Forbidden(object_id, self)
-            recs.append(rec)
+            if not recs[object_id].get(ACCESS_LABEL, True):
+                raise Forbidden(object_id, model)
 
-        rel = self.relationship(relationship_name)
+        rel = model.relationship(relationship_name)
         if rel.cardinality != Cardinality.MANY_TO_MANY:
-            raise APIError('get_merge works only with many-to-many relationships', self)
+            raise APIError('get_merge works only with many-to-many relationships', model)
+        if args.page.cursor is not None:
+            raise APIError('get_merge does not support page cursors', model)
 
-        args = self.parse_arguments(args)
-        rel.load(self)
-        rel.model.init_schema(args)
         filter_by, order_by = rel.model.get_filter_by(args), rel.model.get_order_by(args)
         exclude = set(kwargs.pop('exclude', ()))
-        query = select_merged(self, rel, object_ids,
+        query = select_merged(model, rel, object_ids,
                               filter_by=filter_by, order_by=order_by,
-                              offset=args.page.offset, limit=args.page.limit,
+                              offset=args.page.offset, limit=rel.model.get_page_limit(context),
                               exclude=exclude, options=args.merge)
         log_query(query)
-        data = {rec['id']: dict(rec) for rec in await pg.fetch(query)}
-        data = list(data.values())
-        await rel.model.set_meta(args.page.limit, object_ids, rel, exclude=exclude, options=args.merge,
+        data = {rec['id']: dict(rec) for rec in await fetch(query)}
+        data = rel.model.set_next_meta(context, list(data.values()))
+        await rel.model.set_meta(context, args.page.limit, object_ids, rel, exclude=exclude, options=args.merge,
                                  filter_by=filter_by, merge=True)
-        rel.model.check_size(args, data)
-        await rel.model.fetch_included(data, args)
-        return rel.model.response(data)
+        rel.model.check_size(context, data)
+        rel.model.grant(data)
+        await rel.model.fetch_included(context, data)
+        return rel.model.response(context, data, kwargs.get('encode', False))
 
     def __repr__(self):
         return '<Model({})>'.format(self.name)
@@ -640,6 +1497,7 @@ def _extract_model_args(model, args):
     return model_args
 
 
+@_row_security
 async def get_collection(args, *models, **kwargs):
     """
     Fetch a heterogeneous collection of objects.
@@ -666,8 +1524,8 @@ async def get_collection(args, *models, **kwargs):
         if search_term is None else search_query(models, search_term, limit=ra.page.limit, offset=ra.page.offset)
     log_query(query)
     mixed = list()
-    async with pg.query(query) as cursor:
-        async for row in cursor:
+    async with cursor(query) as rows:
+        async for row in rows:
             mixed.append(dict(type=row['resource_type'], id=row['id']))
 
     data = defaultdict(dict)
@@ -677,23 +1535,22 @@ async def get_collection(args, *models, **kwargs):
         object_id = list(obj['id'] for obj in mixed if model.type_ == obj['type'])
         if len(object_id) > 0:
             model_args = model.parse_arguments(_extract_model_args(model, args))
-            model.init_schema(model_args)
+            model = model.configure(model_args)
+            context = RequestContext(model_args, model.get_concurrency())
             query = select_many(model, filter_by=FilterBy(
                 model.primary_key.in_([cast(x, model.primary_key.type) for x in object_id])))
             log_query(query)
-            recs = [{'type': model.type_, **rec} for rec in await pg.fetch(query)]
-            await model.fetch_included(recs, model_args)
-            for rec in model.schema.dump(recs, many=True):
+            recs = [{'type': model.type_, **rec} for rec in await fetch(query)]
+            await model.fetch_included(context, recs)
+            for rec in model.dump(context, recs):
                 data[rec['type']][rec['id']] = rec
-            if len(model.included) > 0:
-                for resource_type in model.included.keys():
-                    included[resource_type].update(model.included[resource_type])
-        model.reset()
+            for resource_type in context.included.keys():
+                included[resource_type].update(context.included[resource_type])
 
     for (resource_type, query) in (select_mixed(models, count=True) \
             if search_term is None else search_query(models, search_term, count=True)):
-        meta['subTotal'][resource_type] = await pg.fetchval(query)
+        meta['subTotal'][resource_type] = await fetchval(query)
         meta['total'] += meta['subTotal'][resource_type]
     return dict(data=[data[rec['type']][str(rec['id'])] for rec in mixed],
-                included=reduce(lambda a, b: a + [r for r in b.values()], included.values(), list()),
+                included=_flatten(included),
                 meta=meta)
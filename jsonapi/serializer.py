@@ -0,0 +1,344 @@
+"""
+Compiled Serializers.
+
+The :mod:`jsonapi.serializer` module compiles a model (and its current fieldset and included relationships) into
+a set of specialized closures that turn database records straight into JSON API resource objects.
+Attribute keys and value formatters are resolved once, when the serializer is compiled, instead of per record.
+
+The compiled serializer produces the same output as the marshmallow based :class:`jsonapi.model.JSONSchema`,
+and exposes the same interface (``context`` and ``dump``), so it can be used in its place. Both serialize each related
+record once per type and id, whatever the number of include paths referring to it.
+
+The :class:`ResourceEncoder` goes one step further, and writes the response document straight to a byte buffer
+(see :func:`encode_document`): attribute keys are encoded once, when the encoder is compiled, and resource objects
+are never built.
+"""
+import json
+import math
+from collections import defaultdict
+from json.encoder import encode_basestring_ascii
+
+import marshmallow as ma
+from inflection import camelize
+
+from jsonapi.datatypes import JSONField
+from jsonapi.db.table import Cardinality
+from jsonapi.fields import Relationship, get_linkage
+
+SERIALIZERS = ('marshmallow', 'compiled')
+
+
+def _nullable(func):
+    def format_value(value):
+        return None if value is None else func(value)
+    return format_value
+
+
+def _strftime(fmt):
+    def format_value(value):
+        return None if value is None else value.strftime(fmt)
+    return format_value
+
+
+def get_formatter(ma_field):
+    """
+    Resolve the value formatter for a marshmallow field.
+
+    Common field types are mapped to fast paths, any other field falls back to the marshmallow implementation.
+    """
+    if isinstance(ma_field, ma.fields.String):
+        return _nullable(str)
+    if type(ma_field) in (ma.fields.Integer, ma.fields.Float) and not ma_field.as_string:
+        return _nullable(ma_field.num_type)
+    if isinstance(ma_field, ma.fields.DateTime) and ma_field.format is not None \
+            and ma_field.format not in ma_field.SERIALIZATION_FUNCS:
+        return _strftime(ma_field.format)
+
+    def format_value(value):
+        return ma_field._serialize(value, None, None)
+
+    return format_value
+
+
+def _has_relationships(model):
+    return any(isinstance(field, Relationship) and not field.exclude for field in model.fields.values())
+
+
+def compile_resource(model):
+    """
+    Compile the serializer functions for a single model.
+
+    Related records are serialized once per type and id, no matter how many include paths refer to them: a resource
+    reached again is taken from the included resources, and only the relationships of the path it is reached by are
+    added to it (once per path, see the ``memo`` argument).
+
+    :param model: an initialized model (see :meth:`jsonapi.model.Model.init_schema`)
+    :return: a pair of functions, for serializing a record of the primary data, and a related record (as an included
+             resource)
+    """
+    token = object()
+    format_id = get_formatter(model.fields['id'].get_ma_field())
+    attributes = list()
+    relationships = list()
+    for name, field in model.fields.items():
+        if name == 'id' or field.exclude:
+            continue
+        if isinstance(field, Relationship):
+            many = field.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY)
+            _, include = compile_resource(field.model)
+            relationships.append((name, many, include, _has_relationships(field.model)))
+        else:
+            attributes.append((name, camelize(name, False), get_formatter(field.get_ma_field())))
+    attributes = tuple(attributes)
+    relationships = tuple(relationships)
+
+    def wrap(rec):
+        resource = dict(id=format_id(rec['id']), type=rec['type'],
+                        attributes={key: fmt(rec[name]) for name, key, fmt in attributes})
+        if '_ts_rank' in rec:
+            resource['meta'] = dict(rank=rec['_ts_rank'])
+        return resource
+
+    def link(resource, rec, included, memo):
+        if not relationships:
+            return
+        linkage = resource.setdefault('relationships', dict())
+        for name, many, include, nested in relationships:
+            if name in linkage and not nested:
+                continue
+            value = rec[name]
+            if value is None:
+                linked = None
+            elif many:
+                linked = [include(related, included, memo) for related in value]
+            else:
+                linked = include(value, included, memo)
+            if name not in linkage:
+                linkage[name] = get_linkage(linked)
+
+    def dump(rec, included, memo):
+        resource = wrap(rec)
+        link(resource, rec, included, memo)
+        return resource
+
+    def include(rec, included, memo):
+        resources = included[rec['type']]
+        object_id = format_id(rec['id'])
+        resource = resources.get(object_id)
+        if resource is None:
+            resources[object_id] = resource = wrap(rec)
+        key = token, rec['type'], object_id
+        if key not in memo:
+            memo.add(key)
+            link(resource, rec, included, memo)
+        return resource
+
+    return dump, include
+
+
+class CompiledSchema:
+    """
+    A drop-in replacement for the marshmallow schema of a model.
+
+    >>> from jsonapi.tests.model import UserModel
+    >>> model = UserModel()
+    >>> model.init_schema(model.parse_arguments({'include': 'bio'}))
+    >>> schema = CompiledSchema(model)
+    >>> schema.context['root'] = model
+    >>> schema.dump(recs, many=True)
+    """
+
+    def __init__(self, model):
+        self.context = dict()
+        self._dump, _ = compile_resource(model)
+
+    def dump(self, obj, many=False):
+        included = self.context['root'].included
+        memo = set()
+        return [self._dump(rec, included, memo) for rec in obj] if many else self._dump(obj, included, memo)
+
+    def __repr__(self):
+        return '<{}>'.format(self.__class__.__name__)
+
+
+def encode_value(value):
+    """
+    Encode a value as compact JSON. A ``bytes`` value is an encoded JSON fragment, and is returned as is.
+    """
+    if isinstance(value, bytes):
+        return value
+    return json.dumps(value, separators=(',', ':'), default=str).encode()
+
+
+def _encode_str(value):
+    return encode_basestring_ascii(value).encode()
+
+
+def _encode_float(value):
+    return repr(value).encode() if math.isfinite(value) else encode_value(value)
+
+
+def _null(func):
+    def encode(value):
+        return b'null' if value is None else func(value)
+    return encode
+
+
+def get_encoder(ma_field):
+    """
+    Resolve the value encoder for a marshmallow field: a function returning the JSON encoding of a value.
+
+    Common field types are mapped to fast paths. Values of JSON fields are encoded JSON text already, and are copied
+    as is. Any other field falls back to the marshmallow implementation.
+    """
+    if isinstance(ma_field, ma.fields.String):
+        return _null(lambda value: _encode_str(str(value)))
+    if type(ma_field) is ma.fields.Integer and not ma_field.as_string:
+        return _null(lambda value: str(int(value)).encode())
+    if type(ma_field) is ma.fields.Float and not ma_field.as_string:
+        return _null(lambda value: _encode_float(float(value)))
+    if isinstance(ma_field, ma.fields.Boolean):
+        return _null(lambda value: b'true' if value else b'false')
+    if isinstance(ma_field, ma.fields.DateTime) and ma_field.format is not None \
+            and ma_field.format not in ma_field.SERIALIZATION_FUNCS:
+        fmt = ma_field.format
+        return _null(lambda value: _encode_str(value.strftime(fmt)))
+    if isinstance(ma_field, JSONField):
+        return _null(lambda value: value.encode() if isinstance(value, str) else encode_value(value))
+
+    def encode(value):
+        return encode_value(ma_field._serialize(value, None, None))
+
+    return encode
+
+
+class ResourceEncoder:
+    """
+    Writes the resource objects of a model (and its current fieldset and included relationships) to a byte buffer.
+
+    >>> from jsonapi.tests.model import UserModel
+    >>> model = UserModel()
+    >>> model.init_schema(model.parse_arguments({'include': 'bio'}))
+    >>> encode_document(ResourceEncoder(model), recs)
+    """
+
+    def __init__(self, model):
+        self.type_ = model.type_
+        self.format_id = get_formatter(model.fields['id'].get_ma_field())
+        self.head = b',"type":' + _encode_str(model.type_) + b',"attributes":{'
+        self.linkage_tail = b',"type":' + _encode_str(model.type_) + b'}'
+        attributes = list()
+        relationships = list()
+        for name, field in model.fields.items():
+            if name == 'id' or field.exclude:
+                continue
+            if isinstance(field, Relationship):
+                many = field.cardinality in (Cardinality.ONE_TO_MANY, Cardinality.MANY_TO_MANY)
+                relationships.append((name, _encode_str(name) + b':', many, ResourceEncoder(field.model)))
+            else:
+                key = _encode_str(camelize(name, False)) + b':'
+                attributes.append((name, key if not attributes else b',' + key, get_encoder(field.get_ma_field())))
+        self.attributes = tuple(attributes)
+        self.relationships = tuple(relationships)
+
+    def linkage(self, rec):
+        return b'{"id":' + _encode_str(self.format_id(rec['id'])) + self.linkage_tail
+
+    def register(self, rec, included, names=()):
+        """
+        Register the related records of a record as included resources.
+
+        :param names: the names of the relationships registered already (by another include path)
+        :return: the relationships of the record, as (name, key, many, encoder, value) tuples
+        """
+        relationships = list()
+        for name, key, many, encoder in self.relationships:
+            if name in names and not encoder.relationships:
+                continue
+            value = rec[name]
+            if name not in names:
+                relationships.append((name, key, many, encoder, value))
+            if value is not None:
+                for related in (value if many else (value,)):
+                    encoder.include(related, included)
+        return relationships
+
+    def include(self, rec, included):
+        """
+        Add a record to the included resources, keyed by type and id. A resource included through more than one
+        path is written once, with the relationships of all paths, and only the relationships of a path not
+        registered already (or with nested relationships) are registered again.
+        """
+        resources = included[self.type_]
+        object_id = self.format_id(rec['id'])
+        entry = resources.get(object_id)
+        if entry is not None and self in entry[3]:
+            return
+        if entry is None:
+            resources[object_id] = (self, rec, self.register(rec, included), {self})
+        else:
+            entry[3].add(self)
+            entry[2].extend(self.register(rec, included, set(rel[0] for rel in entry[2])))
+
+    def write(self, buf, rec, relationships):
+        buf += b'{"id":'
+        buf += _encode_str(self.format_id(rec['id']))
+        buf += self.head
+        for name, key, encode in self.attributes:
+            buf += key
+            buf += encode(rec[name])
+        buf += b'}'
+        if '_ts_rank' in rec:
+            buf += b',"meta":{"rank":' + encode_value(rec['_ts_rank']) + b'}'
+        if relationships:
+            separator = b',"relationships":{'
+            for _, key, many, encoder, value in relationships:
+                buf += separator + key
+                separator = b','
+                if value is None:
+                    buf += b'null'
+                elif many:
+                    buf += b'[' + b','.join(encoder.linkage(related) for related in value) + b']'
+                else:
+                    buf += encoder.linkage(value)
+            buf += b'}'
+        buf += b'}'
+
+    def __repr__(self):
+        return '<{}({})>'.format(self.__class__.__name__, self.type_)
+
+
+def encode_document(encoder, data, meta=None):
+    """
+    Encode a JSON API response document.
+
+    :param ResourceEncoder encoder: the resource encoder of the primary data
+    :param data: a record, a list of records or ``None``
+    :param dict meta: the meta section (optional)
+    :return: the encoded document (``bytes``)
+    """
+    included = defaultdict(dict)
+    buf = bytearray(b'{"data":')
+    if data is None:
+        buf += b'null'
+    elif isinstance(data, list):
+        buf += b'['
+        for i, rec in enumerate(data):
+            if i > 0:
+                buf += b','
+            encoder.write(buf, rec, encoder.register(rec, included))
+        buf += b']'
+    else:
+        encoder.write(buf, data, encoder.register(data, included))
+    if included:
+        separator = b',"included":['
+        for resources in included.values():
+            for resource_encoder, rec, relationships, _ in resources.values():
+                buf += separator
+                separator = b','
+                resource_encoder.write(buf, rec, relationships)
+        buf += b']'
+    if meta:
+        buf += b',"meta":' + encode_value(meta)
+    buf += b'}'
+    return bytes(buf)
@@ -1,5 +1,8 @@
 import pytest
 
+from jsonapi.args import encode_cursor
+from jsonapi.exc import NotModified
+from jsonapi.model import response_cache
 from jsonapi.tests.util import *
 
 
@@ -13,3 +16,71 @@ async def test_no_args(users, user_count, superuser_id):
         for user in json['data']:
             assert_object(user, 'user', lambda v: int(v) in user_id_list)
         assert 'included' not in json
+
+
+@pytest.mark.asyncio
+async def test_stream(users, superuser_id, monkeypatch):
+    monkeypatch.setattr('jsonapi.model.STREAM_BATCH_SIZE', 7)
+    for args in ({'sort': 'id'},
+                 {'sort': '-created-on,id', 'include': 'bio,articles.keywords', 'page[size]': 30},
+                 {'filter[status]': 'active', 'sort': 'id', 'include': 'articles', 'option[embed]': '*'},
+                 {'sort': 'id', 'page[size]': 20, 'option[count]': 'none'},
+                 {'sort': 'id', 'page[size]': 21, 'option[count]': 'window', 'include': 'bio'}):
+        async with get_collection(dict(args), users, login=superuser_id) as expected:
+            async with stream_collection(dict(args), users, login=superuser_id) as (json, chunks):
+                assert chunks > 2
+                assert json['data'] == expected['data']
+                assert json.get('meta') == expected.get('meta')
+                assert sorted(json.get('included', []), key=lambda r: (r['type'], int(r['id']))) == \
+                    sorted(expected.get('included', []), key=lambda r: (r['type'], int(r['id'])))
+
+
+@pytest.mark.asyncio
+async def test_render(articles, superuser_id):
+    for args in ({'sort': 'id'},
+                 {'sort': '-created-on,id', 'page[size]': 30, 'fields[article]': 'title,body,created-on'},
+                 {'sort': 'id', 'page[size]': 10, 'option[count]': 'window'},
+                 {'sort': 'id', 'page[after]': encode_cursor([10, 10])},
+                 {'filter[is-published]': 't', 'sort': 'id', 'include': 'author'}):
+        async with get_collection(dict(args), articles, login=superuser_id) as expected:
+            async with render_collection(dict(args), articles, login=superuser_id) as json:
+                assert json['data'] == expected['data']
+                assert json.get('meta') == expected.get('meta')
+                assert json.get('included') == expected.get('included')
+
+
+@pytest.mark.asyncio
+async def test_cached(users, superuser_id):
+    response_cache.clear()
+    args = {'include': 'articles', 'sort': 'id', 'page[size]': 5}
+    async with get_collection(dict(args), users, login=superuser_id) as expected:
+        login(superuser_id)
+        try:
+            document, etag = await users.get_cached('get_collection', dict(args))
+            assert json_loads(document) == expected
+            assert await users.get_cached('get_collection', dict(args)) == (document, etag)
+            assert response_cache.hits == 1
+            with pytest.raises(NotModified) as e:
+                await users.get_cached('get_collection', dict(args), if_none_match=etag)
+            assert e.value.etag == etag
+            response_cache.invalidate('public.articles')
+            assert await users.get_cached('get_collection', dict(args), if_none_match='"other"') == (document, etag)
+            assert response_cache.misses == 2
+        finally:
+            logout()
+
+
+@pytest.mark.asyncio
+async def test_validator(users, superuser_id):
+    login(superuser_id)
+    try:
+        args = {'filter[status]': 'active', 'page[size]': 5}
+        etag = await users.get_validator(dict(args))
+        assert await users.get_validator(dict(args)) == etag
+        assert await users.get_validator(dict(args, sort='id')) != etag
+        with pytest.raises(NotModified) as e:
+            await users.get_validator(dict(args), if_none_match=etag)
+        assert e.value.etag == etag
+        assert await users.get_validator({}, 1) != await users.get_validator({}, 2)
+    finally:
+        logout()
@@ -72,3 +72,22 @@ async def test_multiple(users, superuser_id):
     }, users, login=superuser_id) as json:
         for user in json['data']:
             check_include_multiple(json, user)
+
+
+@pytest.mark.asyncio
+async def test_same_type(articles, article_count, superuser_id):
+    article_id_list = sample_integers(1, article_count, 5)
+    async with get_collection({
+        'include': 'author,publisher,comments.user',
+        'filter[id]': ','.join(str(x) for x in article_id_list)
+    }, articles, login=superuser_id) as json:
+        assert len(json['data']) > 0
+        for article in json['data']:
+            check_included(json, article, 'author', 'user', lambda size: size == 1)
+            check_included(json, article, 'publisher', 'user', lambda size: size <= 1)
+            check_included(json, article, 'comments', 'comment')
+        for included in json['included']:
+            if included['type'] == 'comment':
+                check_included(json, included, 'user', 'user', lambda size: size == 1)
+        keys = [(included['type'], included['id']) for included in json['included']]
+        assert len(keys) == len(set(keys))
@@ -55,3 +55,89 @@ async def test_filter(users, user_count):
             assert_attribute(user, 'status', lambda v: v == 'active')
         assert_meta(json, 'total', lambda v: v == user_count)
         assert_meta(json, 'totalFiltered', lambda v: v < user_count)
+
+
+@pytest.mark.asyncio
+async def test_count_window(users, user_count):
+    for step in (3, 10, 50):
+        async with get_collection({
+            'page[size]': step,
+            'page[number]': 2,
+            'option[count]': 'window',
+            'sort': '-article-count'
+        }, users) as json:
+            assert len(json['data']) == step
+            for user in json['data']:
+                assert_object(user, 'user')
+                assert '_total' not in user['attributes']
+            assert_meta(json, 'total', lambda v: v == user_count)
+    async with get_collection({'page[size]': 10, 'page[number]': 1000, 'option[count]': 'window'}, users) as json:
+        assert json['data'] == []
+        assert_meta(json, 'total', lambda v: v == user_count)
+    with pytest.raises(APIError):
+        await users.get_collection({'page[size]': 10, 'option[count]': 'invalid'})
+
+
+@pytest.mark.asyncio
+async def test_count_estimate(users, user_count):
+    async with get_collection({'page[size]': 10, 'option[count]': 'estimate'}, users) as json:
+        assert len(json['data']) == 10
+        assert_meta(json, 'total', lambda v: v >= 0)
+        assert_meta(json, 'estimate', lambda v: v is True)
+    async with get_collection({
+        'page[size]': 10,
+        'filter[status]': 'active',
+        'option[count]': 'estimate'
+    }, users) as json:
+        assert_meta(json, 'total', lambda v: v >= 0)
+        assert_meta(json, 'totalFiltered', lambda v: v >= 0)
+
+
+@pytest.mark.asyncio
+async def test_count_none(users, user_count):
+    async with get_collection({'page[size]': 10, 'option[count]': 'none'}, users) as json:
+        assert len(json['data']) == 10
+        assert 'total' not in json['meta']
+        assert_meta(json, 'hasNext', lambda v: v is True)
+    async with get_collection({
+        'page[size]': 10,
+        'page[number]': (user_count + 9) // 10,
+        'option[count]': 'none'
+    }, users) as json:
+        assert len(json['data']) == user_count - ((user_count + 9) // 10 - 1) * 10
+        assert_meta(json, 'hasNext', lambda v: v is False)
+
+
+@pytest.mark.asyncio
+async def test_cursor(users, user_count):
+    for sort in ('-created-on', 'last,first', 'status'):
+        user_id_list = list()
+        cursor = dict(after='')
+        while len(user_id_list) < user_count:
+            async with get_collection({'page[size]': 50, 'page[after]': cursor['after'], 'sort': sort}, users) as json:
+                assert json['data']
+                start = len(user_id_list)
+                for user in json['data']:
+                    assert_object(user, 'user', lambda v: v not in user_id_list)
+                    user_id_list.append(user['id'])
+                cursor = json['meta']['cursor']
+        async with get_collection({'page[size]': 50, 'page[after]': cursor['after'], 'sort': sort}, users) as json:
+            assert json['data'] == []
+        async with get_collection({'page[size]': 10, 'page[before]': cursor['before'], 'sort': sort}, users) as json:
+            assert [user['id'] for user in json['data']] == user_id_list[max(start - 10, 0):start]
+        async with get_collection({'page[size]': 10, 'page[number]': 3, 'sort': sort + ',id'}, users) as json:
+            assert [user['id'] for user in json['data']] == user_id_list[20:30]
+
+
+@pytest.mark.asyncio
+async def test_deferred(users, monkeypatch):
+    for args in ({'sort': '-created-on,id'},
+                 {'sort': '-article-count,last,id', 'fields[user]': 'email,article-count'},
+                 {'filter[status]': 'active', 'include': 'bio', 'sort': 'id'}):
+        for number in (1, 2, 5):
+            args = dict(args, **{'page[size]': 10, 'page[number]': number})
+            async with get_collection(dict(args), users) as expected:
+                monkeypatch.setattr('jsonapi.model.DEFERRED_OFFSET', 0)
+                async with get_collection(dict(args), users) as json:
+                    assert json == expected
+                monkeypatch.undo()
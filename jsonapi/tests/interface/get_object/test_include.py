@@ -54,3 +54,53 @@ async def test_multiple(users, superuser_id):
                            'bio'
             }, users, int(user['id']), login=superuser_id) as json:
                 check_include_multiple(json, json['data'])
+
+
+@pytest.mark.asyncio
+async def test_concurrent(users, superuser_id, monkeypatch):
+    args = {'include': 'articles.comments.replies,articles.keywords,articles.author,articles.publisher,bio'}
+    async with get_collection({'filter[articles:ne]': 'none', 'page[size]': 3}, users, login=superuser_id) as json:
+        user_ids = [int(user['id']) for user in json['data']]
+    for user_id in user_ids:
+        async with get_object(dict(args), users, user_id, login=superuser_id) as expected:
+            monkeypatch.setattr('jsonapi.model.CONCURRENCY', 4)
+            async with get_object(dict(args), users, user_id, login=superuser_id) as json:
+                assert json == expected
+            monkeypatch.undo()
+
+
+@pytest.mark.asyncio
+async def test_embedded(users, superuser_id):
+    args = {'include': 'articles.comments,articles.keywords,bio'}
+    async with get_collection({'filter[articles:ne]': 'none', 'page[size]': 3}, users, login=superuser_id) as json:
+        user_ids = [int(user['id']) for user in json['data']]
+    for user_id in user_ids:
+        async with get_object(dict(args), users, user_id, login=superuser_id) as expected:
+            for embed in ('articles', 'bio,articles.comments', '*'):
+                async with get_object(dict(args, **{'option[embed]': embed}), users, user_id,
+                                      login=superuser_id) as json:
+                    assert json['data']['attributes'] == expected['data']['attributes']
+                    assert sorted(json['included'], key=lambda r: (r['type'], int(r['id']))) == \
+                        sorted(expected['included'], key=lambda r: (r['type'], int(r['id'])))
+
+
+@pytest.mark.asyncio
+async def test_cached(users, superuser_id, monkeypatch):
+    from jsonapi.model import resource_cache
+    from jsonapi.tests.model import KeywordModel, UserModel
+
+    args = {'include': 'articles.author,articles.keywords,articles.comments.user'}
+    async with get_collection({'filter[articles:ne]': 'none', 'page[size]': 3}, users, login=superuser_id) as json:
+        user_ids = [int(user['id']) for user in json['data']]
+    for user_id in user_ids:
+        async with get_object(dict(args), users, user_id, login=superuser_id) as expected:
+            monkeypatch.setattr(UserModel, 'cache', True)
+            monkeypatch.setattr(KeywordModel, 'cache', True)
+            resource_cache.clear()
+            for _ in range(2):
+                async with get_object(dict(args), users, user_id, login=superuser_id) as json:
+                    assert json['data'] == expected['data']
+                    assert sorted(json['included'], key=lambda r: (r['type'], int(r['id']))) == \
+                        sorted(expected['included'], key=lambda r: (r['type'], int(r['id'])))
+            assert resource_cache.hits > 0
+            monkeypatch.undo()
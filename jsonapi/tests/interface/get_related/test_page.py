@@ -69,3 +69,13 @@ async def test_filter(users, users_with_5_articles, superuser_id):
                 assert_attribute(article, 'isPublished', lambda v: v is True)
             assert_meta(json, 'total', lambda v: v == 5)
             assert_meta(json, 'totalFiltered', lambda v: v <= 5)
+
+
+@pytest.mark.asyncio
+async def test_count_window(users, users_with_5_articles, superuser_id):
+    for user_id in users_with_5_articles:
+        for step in (3, 5, 10):
+            async with get_related({'page[size]': step, 'option[count]': 'window'},
+                                   users, user_id, 'articles', login=superuser_id) as json:
+                assert len(json['data']) == min(step, 5)
+                assert_meta(json, 'total', lambda v: v == 5)
@@ -53,6 +53,7 @@ class ArticleModel(Model):
 
     search = articles_ts
     access = func.check_article_read_access
+    access_tables = article_read_access_t,
     user = current_user
 
 
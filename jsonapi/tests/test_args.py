@@ -1,4 +1,10 @@
-from jsonapi.args import RequestArguments
+import datetime as dt
+from decimal import Decimal
+
+import pytest
+
+from jsonapi.args import RequestArguments, decode_cursor, encode_cursor
+from jsonapi.exc import Error
 
 
 def test_fields_1():
@@ -53,3 +59,29 @@ def test_filter_1():
     assert args.in_filter('author', ())
     assert args.in_filter('first', ('author',))
     assert args.in_filter('is_published', ())
+
+
+def test_page_cursor():
+    values = [dt.datetime(2020, 1, 2, 3, 4, 5), Decimal('1.50'), None, 'text', 10]
+    cursor = encode_cursor(values)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ['2020-01-02T03:04:05', '1.50', None, 'text', 10]
+    args = RequestArguments({'page[size]': '10', 'page[after]': cursor})
+    assert args.page.cursor == ('after', decode_cursor(cursor))
+    assert args.page.offset == 0
+    assert RequestArguments({'page[size]': '10', 'page[before]': ''}).page.cursor == ('before', None)
+    assert RequestArguments({'page[size]': '10'}).page.cursor is None
+    for args in ({'page[after]': cursor},
+                 {'page[size]': '10', 'page[number]': '2', 'page[after]': cursor},
+                 {'page[size]': '10', 'page[after]': cursor, 'page[before]': cursor},
+                 {'page[size]': '10', 'page[after]': 'invalid'},
+                 {'page[size]': '10', 'page[after]': encode_cursor({'id': 1})}):
+        with pytest.raises(Error):
+            RequestArguments(args)
+
+
+def test_key():
+    args = RequestArguments({'sort': 'email', 'page[size]': 10, 'include': 'bio'})
+    assert args.key() == RequestArguments({'include': 'bio', 'page[size]': '10', 'sort': 'email'}).key()
+    assert args.key() != RequestArguments({'include': 'bio', 'page[size]': '10', 'sort': '-email'}).key()
+    assert hash(args.key()) is not None
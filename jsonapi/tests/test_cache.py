@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from jsonapi.cache import LRUCache, ResourceCache
+from jsonapi.exc import Error
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert len(cache) == 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+    assert len(cache) == 2
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.stats() == dict(size=2, maxsize=2, hits=1, misses=1)
+    assert cache.hit_rate == 0.5
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats() == dict(size=0, maxsize=2, hits=0, misses=0)
+
+
+def test_lru_cache_size():
+    for size in (0, -1, None, '1'):
+        with pytest.raises(Error):
+            LRUCache(size)
+
+
+def test_resource_cache():
+    cache = ResourceCache(3)
+    cache.set(('user', '1'), {'id': 1}, ('public.users', 'public.user_names'))
+    cache.set(('user', '2'), {'id': 2}, ('public.users',))
+    cache.set(('keyword', '1'), {'id': 1}, ('public.keywords',))
+    assert cache.get(('user', '1')) == {'id': 1}
+    cache.set(('keyword', '2'), {'id': 2}, ('public.keywords',))
+    assert ('user', '2') not in cache
+    cache.invalidate('public.user_names')
+    assert cache.get(('user', '1')) is None
+    assert len(cache) == 2
+    cache.invalidate('public.keywords')
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+    assert cache.stats()['hits'] == 1
+
+
+def test_resource_cache_limits(monkeypatch):
+    value = {'id': 1, 'body': 'x' * 1000}
+    cache = ResourceCache(100, maxbytes=3000)
+    for i in range(3):
+        cache.set(i, dict(value))
+    assert len(cache) == 2
+    assert cache.nbytes <= 3000
+    cache.set('large', {'body': 'x' * 5000})
+    assert 'large' not in cache
+
+    cache = ResourceCache(100, ttl=10)
+    cache.set('a', value)
+    assert cache.get('a') == value
+    now = time.monotonic()
+    monkeypatch.setattr('jsonapi.cache.time.monotonic', lambda: now + 20)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+    for kwargs in (dict(maxbytes=0), dict(ttl=-1), dict(ttl='1')):
+        with pytest.raises(Error):
+            ResourceCache(10, **kwargs)
@@ -1,9 +1,10 @@
 import pytest
 from sqlalchemy.sql.elements import BinaryExpression
 
-from jsonapi.datatypes import Bool
-from jsonapi.db.filter import FilterClause
-from jsonapi.exc import Error
+from jsonapi.datatypes import Bool, Integer, String
+from jsonapi.db.filter import FILTER_ARRAY_SIZE, FilterClause
+from jsonapi.db.statement import get_binds
+from jsonapi.exc import DataTypeError, Error
 from jsonapi.tests.db import test_data_t
 
 
@@ -31,8 +32,10 @@ def test_filter_clause_bool():
     assert isinstance(fc.get(test_data_t.c.test_bool, 'eq', 'none'), BinaryExpression)
     assert isinstance(fc.get(test_data_t.c.test_bool, 'ne', 't'), BinaryExpression)
     assert isinstance(fc.get(test_data_t.c.test_bool, '', 'f,t'), BinaryExpression)
-    assert isinstance(fc.get(test_data_t.c.test_bool, 'eq', 'f,none'), BinaryExpression)
-    assert isinstance(fc.get(test_data_t.c.test_bool, 'ne', 'f,none'), BinaryExpression)
+    assert str(fc.get(test_data_t.c.test_bool, 'eq', 'f,none')) == \
+        'public.test_data.test_bool IN (:test_bool_1) OR public.test_data.test_bool IS NULL'
+    assert str(fc.get(test_data_t.c.test_bool, 'ne', 'f,none')) == \
+        'public.test_data.test_bool NOT IN (:test_bool_1) AND public.test_data.test_bool IS NOT NULL'
 
     with pytest.raises(Error, match='invalid operator: gt'):
         fc.get(test_data_t.c.test_bool, 'gt', 'f')
@@ -42,3 +45,44 @@ def test_filter_clause_bool():
         fc.get(test_data_t.c.test_bool, 'ge', 'none')
     with pytest.raises(Error, match='invalid operator: le'):
         fc.get(test_data_t.c.test_bool, 'le', 't,f')
+
+
+def test_filter_clause_array():
+    fc = Integer.filter_clause
+    values = ','.join(str(x) for x in range(FILTER_ARRAY_SIZE))
+    clause = fc.get(test_data_t.c.test_int, '', values)
+    assert str(clause) == 'public.test_data.test_int = ANY (CAST(:param_1 AS ARRAY))'
+    bind, = get_binds(clause)
+    assert bind.effective_value == list(range(FILTER_ARRAY_SIZE))
+    assert fc.shape('', values) == fc.shape('', values + ',1000') == ('', list, False)
+    assert 'ALL' in str(fc.get(test_data_t.c.test_int, 'ne', values))
+    assert 'IN' in str(fc.get(test_data_t.c.test_int, '', values[2:]))
+    assert 'ANY' not in str(fc.get(test_data_t.c.test_int, '', '<10,' + values))
+    with pytest.raises(DataTypeError):
+        fc.get(test_data_t.c.test_int, '', values + ',x')
+
+
+def test_filter_clause_null():
+    fc = Integer.filter_clause
+    col = test_data_t.c.test_int
+    values = ','.join(str(x) for x in range(FILTER_ARRAY_SIZE))
+
+    clause = fc.get(col, '', 'null,' + values)
+    assert str(clause) == 'public.test_data.test_int = ANY (CAST(:param_1 AS ARRAY)) ' \
+                          'OR public.test_data.test_int IS NULL'
+    bind, = get_binds(clause)
+    assert bind.effective_value == list(range(FILTER_ARRAY_SIZE))
+    assert str(fc.get(col, 'ne', values + ',null')) == 'public.test_data.test_int != ALL (CAST(:param_1 AS ARRAY)) ' \
+                                                       'AND public.test_data.test_int IS NOT NULL'
+    assert fc.shape('', values + ',null') != fc.shape('', values + ',1000')
+
+    assert str(fc.get(col, '', '1,null,2')) == 'public.test_data.test_int IN (:test_int_1, :test_int_2) ' \
+                                               'OR public.test_data.test_int IS NULL'
+    assert str(fc.get(col, '', 'null,none')) == 'public.test_data.test_int IS NULL'
+    assert str(fc.get(col, '', '1,null,<0')).endswith(' OR public.test_data.test_int IS NULL')
+
+
+def test_parse_many():
+    assert Integer.parse_many(['1', '2', 'null']) == [1, 2, None]
+    assert String.parse_many(['a', 'None']) == ['a', None]
+    assert String.parse_many(['a', 'b']) == ['a', 'b']
@@ -1,9 +1,15 @@
+import datetime as dt
+
 import pytest
 
+from jsonapi.args import decode_cursor, encode_cursor
 from jsonapi.datatypes import Bool, String
-from jsonapi.exc import ModelError
-from jsonapi.model import Field, Model
-from jsonapi.tests.db import test_data_t, users_t
+from jsonapi.exc import APIError, Error, ModelError
+from jsonapi.db.table import RowLevelSecurity
+from jsonapi.model import MANY_TO_ONE, Field, Model, Relationship, RequestContext, access_cache, model_cache, \
+    resource_cache, schema_cache
+from jsonapi.tests.auth import current_user, login, logout
+from jsonapi.tests.db import articles_t, test_data_t, users_t
 
 
 class NoFromModel(Model):
@@ -25,6 +31,13 @@ class InvalidFieldModel(Model):
     fields = test_data_t.c.test_int
 
 
+class RowSecurityModel(Model):
+    from_ = articles_t
+    fields = 'title', Relationship('author', 'UserModel', MANY_TO_ONE, articles_t.c.author_id)
+    access = RowLevelSecurity()
+    user = current_user
+
+
 class FooModel(Model):
     from_ = test_data_t
 
@@ -81,3 +94,254 @@ def test_1_fields():
     model = FieldNotFoundModel()
     with pytest.raises(ModelError, match='not found'):
         model.init_schema(model.parse_arguments({}))
+
+
+def test_1_schema_cache():
+    model = FooBarModel()
+    model.init_schema(model.parse_arguments({'fields[test]': 'test-int'}))
+    schema = model.schema
+    hits = schema_cache.hits
+
+    model.fields['test_int'].exclude = None
+    model.init_schema(model.parse_arguments({'fields[test]': 'test-int'}))
+    assert model.schema is schema
+    assert model.fields['test_int'].exclude is None
+    assert schema_cache.hits == hits
+    assert FooBarModel().init_schema(model.parse_arguments({'fields[test]': 'test-int'})) is None
+    assert schema_cache.hits == hits + 1
+
+    model.init_schema(model.parse_arguments({'fields[test]': 'test-float'}))
+    assert model.schema is not schema
+    assert 'test_float' in model.schema.fields
+    assert 'test_int' not in model.schema.fields
+
+
+def test_1_configure():
+    from jsonapi.tests.model import UserModel
+
+    model = UserModel()
+    args = model.parse_arguments({'include': 'articles', 'fields[user]': 'email', 'fields[article]': 'title'})
+    configured = model.configure(args)
+    assert configured is not model
+    assert model.schema is None
+    assert model.fields['email'].exclude is False
+    assert configured.fields['articles'].model is not None
+    assert model.fields['articles'].model is None
+    assert configured.fields['first'].exclude is True
+    assert UserModel().configure(model.parse_arguments(
+        {'fields[article]': 'title', 'fields[user]': 'email', 'include': 'articles'})) is configured
+    assert model_cache.stats()['hits'] > 0
+
+    other = model.configure(model.parse_arguments({}))
+    assert other is not configured
+    assert other.fields['first'].exclude is False
+    assert configured.fields['first'].exclude is True
+
+    related = model.configure(model.parse_arguments({'fields[article]': 'title'}), 'articles')
+    assert related.fields['articles'].model.fields['body'].exclude is True
+    assert related.fields['articles'].model.schema is not None
+
+    context = RequestContext(args)
+    rec = dict(id=1, type='user', email='user@example.com', articles=[dict(id=2, type='article', title='title')])
+    document = configured.response(context, rec)
+    assert document['included'] == [dict(id='2', type='article', attributes=dict(title='title'))]
+    assert len(context.included) == 1
+    assert 'included' not in configured.response(RequestContext(args), dict(rec, articles=[]))
+
+
+def test_1_configure_serializer(monkeypatch):
+    from jsonapi import model as model_module
+    from jsonapi.serializer import CompiledSchema
+    from jsonapi.tests.model import UserModel
+
+    model = UserModel()
+    args = model.parse_arguments({'fields[user]': 'email'})
+    configured = model.configure(args)
+    assert not isinstance(configured.schema, CompiledSchema)
+
+    monkeypatch.setattr(model_module, 'SERIALIZER', 'compiled')
+    compiled = model.configure(args)
+    assert compiled is not configured
+    assert isinstance(compiled.schema, CompiledSchema)
+    assert isinstance(model.configure(args, 'articles').fields['articles'].model.schema, CompiledSchema)
+
+
+def test_1_concurrency():
+    class ConcurrentModel(FooBarModel):
+        concurrency = 4
+
+    class InvalidConcurrencyModel(FooBarModel):
+        concurrency = 0
+
+    assert FooBarModel().get_concurrency() == 1
+    assert ConcurrentModel().get_concurrency() == 4
+    with pytest.raises(ModelError, match='invalid concurrency'):
+        InvalidConcurrencyModel().get_concurrency()
+
+
+def test_1_cache():
+    from jsonapi.tests.model import ArticleModel, UserModel
+
+    class CachedUserModel(UserModel):
+        cache = True
+
+    class CachedArticleModel(ArticleModel):
+        cache = True
+
+    assert UserModel().get_cache() is None
+    assert CachedArticleModel().get_cache() is None
+    model = CachedUserModel()
+    model.init_schema(model.parse_arguments({'fields[cached-user]': 'email'}))
+    assert model.get_cache() is resource_cache
+    assert model.cache_key(1) == ('cached-user', ('email', 'id'), '1')
+
+    resource_cache.clear()
+    model.cache_record(dict(id=1, email='a@b.c'))
+    rec = resource_cache.get(model.cache_key('1'))
+    assert rec == dict(id=1, email='a@b.c')
+    resource_cache.invalidate('public.user_names')
+    assert resource_cache.get(model.cache_key('1')) is None
+
+
+def test_1_row_security():
+    from jsonapi.model import _get_settings
+    from jsonapi.tests.model import UserModel
+
+    assert _get_settings(({}, UserModel())) == {}
+    assert _get_settings((UserModel,)) == {}
+    try:
+        login(1)
+        assert _get_settings(({}, RowSecurityModel())) == {'app.user_id': '1'}
+        logout()
+        assert _get_settings((RowSecurityModel,)) == {'app.user_id': ''}
+    finally:
+        logout()
+    with pytest.raises(Error):
+        RowLevelSecurity('user_id')
+
+
+def test_1_grants(monkeypatch):
+    from jsonapi import model as model_module
+    from jsonapi.tests.model import ArticleModel, UserModel
+
+    class GrantedArticleModel(ArticleModel):
+        cache_access = True
+
+    class StrictArticleModel(ArticleModel):
+        type_ = 'granted-article'
+        cache_access = True
+
+    access_cache.clear()
+    model = GrantedArticleModel()
+    try:
+        model.grant([dict(id=3), dict(id=1)])
+        assert model.get_grants() is None
+        login(1)
+        model.grant([dict(id=3), dict(id=1)])
+        model.grant([dict(id=2)])
+        assert model.get_grants() == [1, 2, 3]
+        assert StrictArticleModel().get_grants() is None
+        monkeypatch.setattr(model_module, 'ACCESS_GRANTS_LIMIT', 5)
+        model.grant([dict(id=i) for i in range(10, 0, -1)])
+        assert model.get_grants() == [1, 2, 3, 4, 5]
+        ArticleModel().grant([dict(id=4)])
+        assert ArticleModel().get_grants() is None
+        login(2)
+        assert model.get_grants() is None
+        login(1)
+        access_cache.invalidate('public.article_read_access')
+        assert model.get_grants() is None
+        user = UserModel()
+        user.grant([dict(id=1)])
+        assert user.get_grants() is None
+        assert len(access_cache) == 0
+    finally:
+        logout()
+        access_cache.clear()
+
+
+def test_1_etag():
+    from jsonapi.model import _etag_matches
+
+    assert _etag_matches('"abc"', '"abc"')
+    assert _etag_matches('"abc"', '"xyz", W/"abc"')
+    assert _etag_matches('"abc"', '*')
+    assert not _etag_matches('"abc"', '"xyz"')
+    assert not _etag_matches('"abc"', None)
+
+
+def test_1_embedded():
+    from jsonapi.tests.model import UserModel
+
+    model = UserModel()
+    args = model.parse_arguments({'include': 'articles.comments,bio', 'option[embed]': 'articles'})
+    context = RequestContext(args)
+    assert context.embeds('articles')
+    assert not context.embeds('bio')
+    assert not context.embeds('comments', ('articles',))
+    assert RequestContext(model.parse_arguments({'option[embed]': '*'})).embeds('comments', ('articles',))
+
+    configured = model.configure(args)
+    embed = configured.get_embedded(context)
+    assert [rel.name for rel, _ in embed] == ['articles']
+    assert embed[0][1] == ()
+
+    rel = configured.fields['articles']
+    recs = rel.model.load_embedded('[{"id": 1, "title": "title", "created_on": "2020-01-02T03:04:05.5"}]')
+    assert recs == [dict(id=1, title='title', created_on=dt.datetime(2020, 1, 2, 3, 4, 5, 500000))]
+    assert rel.model.load_embedded(None) == []
+
+
+def test_1_count_mode():
+    model = FooBarModel()
+
+    def context(args):
+        return RequestContext(model.parse_arguments(args))
+
+    assert model.count_mode(context({})) == 'exact'
+    assert model.get_page_limit(context({'page[size]': '10'})) == 10
+    with pytest.raises(APIError, match='invalid count option'):
+        model.count_mode(context({'option[count]': 'all'}))
+
+    ctx = context({'page[size]': '2', 'option[count]': 'none'})
+    assert model.get_page_limit(ctx) == 3
+    assert model.set_next_meta(ctx, [1, 2, 3]) == [1, 2]
+    assert ctx.meta['hasNext'] is True
+    assert model.set_next_meta(ctx, [1]) == [1]
+    assert ctx.meta['hasNext'] is False
+    assert model.set_next_meta(ctx, [1, 2], 2) == [1, 2]
+    assert ctx.meta['hasNext'] is False
+    assert model.set_next_meta(ctx, [3], 3) == []
+    assert ctx.meta['hasNext'] is True
+    assert model.set_next_meta(ctx, [2, 3], 3) == [2]
+
+    ctx = context({'page[size]': '2', 'option[count]': 'window'})
+    assert model.count_window(ctx)
+    assert not model.count_window(ctx, search_term='term')
+    assert model.set_next_meta(ctx, [1, 2, 3]) == [1, 2, 3]
+    assert 'hasNext' not in ctx.meta
+
+
+def test_1_keyset():
+    from jsonapi.tests.model import UserModel
+
+    model = UserModel()
+    cursor = encode_cursor(['2020-01-02T03:04:05', 'Smith', 10])
+    args = model.parse_arguments({'sort': '-created-on,last', 'page[size]': '2', 'page[before]': cursor})
+    configured = model.configure(args)
+    context = RequestContext(args)
+    order_by = configured.get_order_by(args)
+    assert configured.get_keyset(context, order_by) == ('before', [dt.datetime(2020, 1, 2, 3, 4, 5), 'Smith', 10])
+
+    recs = [dict(id=2, _key_0=dt.datetime(2020, 1, 1), _key_1='b'),
+            dict(id=1, _key_0=dt.datetime(2020, 1, 1), _key_1='a')]
+    assert configured.set_cursor_meta(context, order_by, recs) == [dict(id=1), dict(id=2)]
+    assert decode_cursor(context.meta['cursor']['before']) == ['2020-01-01T00:00:00', 'a', 1]
+    assert decode_cursor(context.meta['cursor']['after']) == ['2020-01-01T00:00:00', 'b', 2]
+
+    for args in ({'sort': 'article-count', 'page[size]': '2', 'page[after]': ''},
+                 {'sort': 'last', 'page[size]': '2', 'page[after]': cursor}):
+        args = model.parse_arguments(args)
+        configured = model.configure(args)
+        with pytest.raises(APIError):
+            configured.get_keyset(RequestContext(args), configured.get_order_by(args))
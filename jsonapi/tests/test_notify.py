@@ -0,0 +1,22 @@
+from jsonapi.db.notify import NOTIFY_CHANNEL, NOTIFY_FUNCTION, create_triggers, get_tables
+from jsonapi.tests.model import ArticleModel, KeywordModel, UserModel
+
+
+def test_tables():
+    assert get_tables(UserModel()) == {'public.users', 'public.user_names', 'public.articles',
+                                       'public.user_followers'}
+    assert get_tables(KeywordModel()) == {'public.keywords', 'public.article_keywords'}
+    model = UserModel()
+    model.init_schema()
+    rel = model.relationship('articles')
+    rel.load(model)
+    assert get_tables(rel.model) == get_tables(ArticleModel())
+    assert 'public.article_read_access' in get_tables(ArticleModel())
+
+
+def test_create_triggers():
+    statements = create_triggers(UserModel(), KeywordModel())
+    assert NOTIFY_CHANNEL in statements[0]
+    assert len(statements) == 1 + 2 * 6
+    assert statements[1] == 'DROP TRIGGER IF EXISTS {} ON public.article_keywords'.format(NOTIFY_FUNCTION)
+    assert all('FOR EACH STATEMENT' in sql for sql in statements[2::2])
@@ -0,0 +1,154 @@
+import datetime as dt
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+import pytest
+
+from jsonapi.datatypes import Bool, Date, DateTime, Float, Integer, JSON, String, Time
+from jsonapi.db.table import MANY_TO_MANY, ONE_TO_MANY
+from jsonapi.exc import ModelError
+from jsonapi.fields import Relationship
+from jsonapi.model import RequestContext
+from jsonapi.serializer import CompiledSchema
+from jsonapi.tests.model import ArticleModel, TestModel, UserModel
+
+VALUES = {
+    Bool: lambda i: i % 2 == 0,
+    Integer: lambda i: i,
+    Float: lambda i: Decimal('{}.25'.format(i)),
+    String: lambda i: 'value {}'.format(i),
+    Date: lambda i: dt.date(2019, 1, 1 + i % 28),
+    DateTime: lambda i: dt.datetime(2019, 1, 1, i % 24, 30, tzinfo=dt.timezone.utc),
+    Time: lambda i: dt.time(i % 24, 15),
+    JSON: lambda i: '{{"value": {}}}'.format(i)
+}
+
+
+def make_rec(model, i):
+    rec = dict(type=model.type_, id=i)
+    for name, field in model.fields.items():
+        if isinstance(field, Relationship):
+            if not field.exclude:
+                if field.cardinality in (ONE_TO_MANY, MANY_TO_MANY):
+                    rec[name] = [make_rec(field.model, i * 10 + j) for j in range(3)]
+                else:
+                    rec[name] = make_rec(field.model, i % 2) if i % 3 else None
+        elif name != 'id' and field.expr is not None:
+            rec[name] = None if i % 5 == 4 else VALUES[field.data_type](i)
+    return rec
+
+
+def dump_both(model, args, n=10):
+    model.init_schema(model.parse_arguments(args))
+    recs = [make_rec(model, i) for i in range(n)]
+    expected = model.response(RequestContext(), recs)
+    model.schema = CompiledSchema(model)
+    return expected, model.response(RequestContext(), [make_rec(model, i) for i in range(n)])
+
+
+@pytest.mark.parametrize('model, args', [
+    (TestModel(), {}),
+    (UserModel(), {'fields[user]': 'email,name,created-on,article-count'}),
+    (UserModel(), {'include': 'bio,articles.keywords,followers'}),
+    (ArticleModel(), {'include': 'author.bio,publisher,keywords,comments.replies,comments.user'}),
+    (ArticleModel(), {'include': 'author,publisher', 'fields[user]': 'email', 'fields[article]': 'title'})
+])
+def test_compiled_output(model, args):
+    expected, result = dump_both(model, args)
+    assert result == expected
+    assert ('include' in args) == ('included' in expected)
+    if 'included' in expected:
+        assert [(r['type'], r['id']) for r in result['included']] == \
+               [(r['type'], r['id']) for r in expected['included']]
+
+
+@pytest.mark.parametrize('model, args', [
+    (TestModel(), {}),
+    (UserModel(), {'fields[user]': 'email,name,created-on,article-count'}),
+    (UserModel(), {'include': 'bio,articles.keywords,followers'}),
+    (ArticleModel(), {'include': 'author.bio,publisher,keywords,comments.replies,comments.user'}),
+    (ArticleModel(), {'include': 'author,publisher', 'fields[user]': 'email', 'fields[article]': 'title'})
+])
+def test_encoded_output(model, args):
+    model.init_schema(model.parse_arguments(args))
+    context = RequestContext()
+    context.meta['total'] = 10
+    expected = model.response(context, [make_rec(model, i) for i in range(10)])
+    result = model.response(context, [make_rec(model, i) for i in range(10)], encode=True)
+    assert isinstance(result, bytes)
+    result = json.loads(result)
+    assert result['data'] == expected['data']
+    assert result['meta'] == expected['meta']
+    assert sorted(result.get('included', []), key=lambda r: (r['type'], r['id'])) == \
+        sorted(expected.get('included', []), key=lambda r: (r['type'], r['id']))
+    rec = make_rec(model, 1)
+    rec['_ts_rank'] = 0.5
+    assert json.loads(model.response_bytes(RequestContext(), rec))['data'] == \
+        model.response(RequestContext(), dict(make_rec(model, 1), _ts_rank=0.5))['data']
+    assert json.loads(model.response_bytes(RequestContext(), None)) == {'data': None}
+
+
+class CountingDict(dict):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = defaultdict(int)
+
+    def __getitem__(self, key):
+        self.reads[key] += 1
+        return super().__getitem__(key)
+
+
+@pytest.mark.parametrize('engine', ['marshmallow', 'compiled', 'encode'])
+def test_shared_records(engine):
+    model = ArticleModel()
+    model.init_schema(model.parse_arguments({'include': 'author,comments.user.bio'}))
+    if engine != 'marshmallow':
+        model.schema = CompiledSchema(model)
+    author = CountingDict(make_rec(model.fields['author'].model, 1))
+    author['bio'] = make_rec(model.fields['comments'].model.fields['user'].model.fields['bio'].model, 1)
+    recs = list()
+    for i in range(10):
+        rec = make_rec(model, i)
+        rec['author'] = author
+        for comment in rec['comments']:
+            comment['user'] = author
+        recs.append(rec)
+    response = model.response(RequestContext(), recs, engine == 'encode')
+    assert author.reads['email'] == 1
+    assert author.reads['bio'] == 1
+    if engine == 'encode':
+        response = json.loads(response)
+    users = [r for r in response['included'] if (r['type'], r['id']) == ('user', '1')]
+    assert len(users) == 1
+    assert users[0]['relationships']['bio'] == dict(id='1', type='user-bio')
+    assert [(r['type'], r['id']) for r in response['included']].count(('user-bio', '1')) == 1
+
+
+def test_compiled_object():
+    model = ArticleModel()
+    model.init_schema(model.parse_arguments({'include': 'author'}))
+    rec = make_rec(model, 1)
+    rec['_ts_rank'] = 0.5
+    expected = model.response(RequestContext(), rec)
+    model.schema = CompiledSchema(model)
+    rec = make_rec(model, 1)
+    rec['_ts_rank'] = 0.5
+    assert model.response(RequestContext(), rec) == expected
+
+
+def test_serializer_option():
+    class CompiledUserModel(UserModel):
+        serializer = 'compiled'
+
+    class InvalidUserModel(UserModel):
+        serializer = 'json'
+
+    model = CompiledUserModel()
+    model.init_schema(model.parse_arguments({}))
+    assert isinstance(model.schema, CompiledSchema)
+
+    model = InvalidUserModel()
+    with pytest.raises(ModelError, match='invalid serializer'):
+        model.init_schema(model.parse_arguments({}))
@@ -0,0 +1,369 @@
+import datetime as dt
+
+import pytest
+import sqlalchemy as sa
+
+from jsonapi.db.query import ACCESS_LABEL, EMBED_LABEL, PAGE_LABEL, RENDER_LABEL, VERSION_LABEL, WINDOW_LABEL, \
+    exists, select_access, select_linkage, select_many, select_objects, select_one, select_related, select_reltuples, \
+    select_version
+from jsonapi.db.statement import Statement, statement_cache
+from jsonapi.db.table import AccessSet, RowLevelSecurity
+from jsonapi.model import access_cache
+from jsonapi.tests.auth import login, logout
+from jsonapi.tests.db import article_read_access_t, articles_t
+from jsonapi.tests.model import ArticleModel, UserModel
+
+
+def many(model, args, search_term=None):
+    args = model.parse_arguments(args)
+    model.init_schema(args)
+    return select_many(model, filter_by=model.get_filter_by(args), order_by=model.get_order_by(args),
+                       offset=args.page.offset, limit=args.page.limit, search_term=search_term)
+
+
+def totals(model, args, search_term=None):
+    args = model.parse_arguments(args)
+    model.init_schema(args)
+    return select_many(model, filter_by=model.get_filter_by(args), search_term=search_term, totals=True)
+
+
+def one(model, object_id, embed=()):
+    model.init_schema()
+    return select_one(model, object_id, embed)
+
+
+def related(model, args, object_id, name):
+    args = model.parse_arguments(args)
+    model.init_schema(args)
+    rel = model.relationship(name)
+    rel.load(model)
+    rel.model.init_schema(args, parents=(name,))
+    return select_related(rel, object_id, filter_by=rel.model.get_filter_by(args),
+                          order_by=rel.model.get_order_by(args),
+                          offset=args.page.offset, limit=args.page.limit)
+
+
+def check(build, first, second):
+    statement_cache.clear()
+    build(*first)
+    cached = build(*second)
+    assert isinstance(cached, Statement)
+    assert statement_cache.stats()['hits'] == 1
+    statement_cache.clear()
+    fresh = build(*second)
+    assert cached.sql == fresh.sql
+    assert cached.args == fresh.args
+    return cached
+
+
+@pytest.mark.parametrize('first, second', [
+    ({}, {}),
+    ({'page[size]': '10'}, {'page[size]': '20', 'page[number]': '3'}),
+    ({'filter[email:eq]': 'a@b.c', 'sort': '-created-on'}, {'filter[email:eq]': 'x@y.z', 'sort': '-created-on'}),
+    ({'filter[id]': '1,2,3'}, {'filter[id]': '4,5,6'}),
+    ({'filter[id]': '<10,>20'}, {'filter[id]': '<100,>200'}),
+    ({'filter[id]': ','.join(map(str, range(1000)))}, {'filter[id]': ','.join(map(str, range(2000)))}),
+    ({'filter[article-count:gt]': '1', 'fields[user]': 'email'},
+     {'filter[article-count:gt]': '5', 'fields[user]': 'email'}),
+    ({'filter[articles.title]': 'a', 'sort': 'articles.title'},
+     {'filter[articles.title]': 'b', 'sort': 'articles.title'})])
+def test_select_many(first, second):
+    statement = check(lambda args: many(UserModel(), args), (first,), (second,))
+    assert statement.args == many(UserModel(), second).args
+
+
+def test_search():
+    statement = check(lambda term: many(UserModel(), {'page[size]': '5'}, term), ('john',), ('jane',))
+    assert statement.args.count('jane') == 2
+    check(lambda term: many(UserModel(), {}, term), ('john smith',), ('jane doe',))
+
+
+def test_select_one():
+    statement = check(lambda object_id: one(UserModel(), object_id), (1,), (2,))
+    assert 2 in statement.args
+    check(lambda object_id: exists(UserModel(), object_id), (1,), (2,))
+
+
+def test_protected():
+    try:
+        login(1)
+        check(lambda args: many(ArticleModel(), args), ({'page[size]': '5'},), ({'page[size]': '10'},))
+        statement = check(lambda object_id: one(ArticleModel(), object_id), (1,), (2,))
+        assert statement.args.count(1) == 1
+        columns, where = statement.sql.split('WHERE')
+        assert 'AS {}'.format(ACCESS_LABEL) in columns
+        assert 'check_article_read_access' not in where
+        logout()
+        statement = check(lambda object_id: one(ArticleModel(), object_id), (1,), (2,))
+        assert statement.args == [2]
+    finally:
+        logout()
+
+
+def test_grants():
+    class GrantsModel(ArticleModel):
+        cache_access = True
+
+    access_cache.clear()
+    try:
+        login(1)
+        plain = one(GrantsModel(), 1)
+        GrantsModel().grant([dict(id=1), dict(id=2)])
+        statement = check(lambda object_id: one(GrantsModel(), object_id), (1,), (2,))
+        assert statement.sql != plain.sql
+        assert statement.args == [[1, 2], 1, 2]
+        assert 'ANY ($1) OR check_article_read_access' in statement.sql
+        GrantsModel().grant([dict(id=3)])
+        assert many(GrantsModel(), {'page[size]': '5'}).args == [[1, 2, 3], 1, 5, 0]
+    finally:
+        logout()
+        access_cache.clear()
+
+
+def test_select_access():
+    def access(obj_ids):
+        model = ArticleModel()
+        model.init_schema()
+        return select_access(model, obj_ids)
+
+    try:
+        login(1)
+        statement = check(access, ([1],), ([1, 2, 3],))
+        assert statement.sql.startswith('SELECT public.articles.id AS id, coalesce(check_article_read_access(')
+        assert statement.sql.endswith('articles.id = ANY (CAST($2 AS INTEGER[]))')
+        assert statement.args == [1, [1, 2, 3]]
+    finally:
+        logout()
+    model = UserModel()
+    model.init_schema()
+    assert ACCESS_LABEL not in select_access(model, [1]).sql
+
+
+def test_access_set():
+
+    class AccessSetModel(ArticleModel):
+        access = AccessSet(lambda user_id: sa.union(
+            sa.select([articles_t.c.id]).where(articles_t.c.author_id == user_id),
+            sa.select([article_read_access_t.c.article_id]).where(article_read_access_t.c.user_id == user_id)))
+
+    try:
+        login(1)
+        statement = check(lambda args: many(AccessSetModel(), args), ({'page[size]': '5'},), ({'page[size]': '10'},))
+        assert statement.args == [1, 10, 0]
+        assert 'public.articles.id IN (SELECT public.articles.id' in statement.sql
+        assert 'check_article_read_access' not in statement.sql
+        statement = check(lambda object_id: one(AccessSetModel(), object_id), (1,), (2,))
+        assert 'AS {}'.format(ACCESS_LABEL) in statement.sql
+        logout()
+        statement = many(AccessSetModel(), {})
+        assert 'false' in statement.sql
+        assert 'UNION' not in statement.sql
+    finally:
+        logout()
+
+
+def test_row_security():
+
+    class RowSecurityArticleModel(ArticleModel):
+        access = RowLevelSecurity()
+
+    try:
+        login(1)
+        statement = check(lambda args: many(RowSecurityArticleModel(), args), ({'page[size]': '5'},),
+                          ({'page[size]': '10'},))
+        assert statement.args == [10, 0]
+        assert 'WHERE' not in statement.sql
+        statement = check(lambda object_id: one(RowSecurityArticleModel(), object_id), (1,), (2,))
+        assert ACCESS_LABEL not in statement.sql
+        assert statement.args == [2]
+    finally:
+        logout()
+
+
+def test_select_related():
+    check(lambda object_id: related(UserModel(), {'page[size]': '5'}, object_id, 'articles'), (1,), (2,))
+    login(1)
+    try:
+        statement_cache.clear()
+        first = related(UserModel(), {}, [1, 2, 3], 'articles')
+        second = related(UserModel(), {}, list(range(20000)), 'articles')
+        assert first.sql == second.sql
+        assert statement_cache.stats()['hits'] == 1
+        assert second.sql.endswith('author_id = ANY (CAST($2 AS INTEGER[]))')
+        assert second.args == [1, list(range(20000))]
+    finally:
+        logout()
+
+
+def test_linkage():
+    def links(*obj_ids):
+        model = UserModel()
+        model.init_schema(model.parse_arguments({'include': 'articles,bio'}))
+        return select_linkage([(model.fields['articles'], obj_ids[0]), (model.fields['bio'], obj_ids[1])])
+
+    statement = check(links, ([1, 2], [1]), (list(range(20000)), [3, 4]))
+    assert statement.sql.count('UNION ALL') == 1
+    assert statement.sql.count('= ANY (CAST(') == 2
+    assert statement.args == [list(range(20000)), [3, 4]]
+
+    def objects(obj_ids):
+        model = ArticleModel()
+        model.init_schema()
+        return select_objects(model, obj_ids)
+
+    statement = check(objects, ([1, 2],), (list(range(20000)),))
+    assert statement.sql.endswith('articles.id = ANY (CAST($1 AS INTEGER[]))')
+    assert statement.args == [list(range(20000))]
+
+
+def test_totals():
+    statement = check(lambda term: totals(UserModel(), {'filter[email:eq]': 'a@b.c'}, term), ('john',), ('jane',))
+    assert statement.sql.count('FILTER') == 2
+    assert statement.sql.count('FROM') == 2
+    assert statement.args == ['a@b.c', 'jane']
+    statement = totals(UserModel(), {'filter[articles.title]': 'a'})
+    assert 'bool_or' in statement.sql
+    assert statement.sql.count('FROM') == 2
+    statement = totals(UserModel(), {'filter[article-count:gt]': '1'})
+    assert statement.sql.count('count(*)') == 2
+    assert 'FILTER' not in statement.sql
+
+
+def test_window():
+    model = UserModel()
+    model.init_schema(model.parse_arguments({'sort': 'article-count'}))
+    order_by = model.get_order_by(model.parse_arguments({'sort': 'article-count'}))
+    statement = select_many(model, order_by=order_by, limit=10, window=True)
+    assert 'count(*) OVER () AS {}'.format(WINDOW_LABEL) in statement.sql
+    assert 'GROUP BY' in statement.sql
+    assert statement.sql != select_many(model, order_by=order_by, limit=10).sql
+
+
+def test_reltuples():
+    statement = select_reltuples(UserModel())
+    assert statement.args == ['public.users']
+    assert 'to_regclass' in statement.sql
+
+
+def test_keyset():
+    model = UserModel()
+    args = model.parse_arguments({'sort': '-created-on,last'})
+    model.init_schema(args)
+    order_by = model.get_order_by(args)
+
+    def keyset(direction, values):
+        return select_many(model, order_by=order_by, limit=10, keyset=(direction, values))
+
+    statement = check(keyset, ('after', [dt.datetime(2020, 1, 1), 'a', 1]),
+                      ('after', [dt.datetime(2020, 2, 1), 'b', 2]))
+    assert statement.args.count('b') == 2
+    assert '_key_1' in statement.sql
+    assert keyset('after', [dt.datetime(2020, 1, 1), None, 1]).sql != statement.sql
+    assert keyset('before', [dt.datetime(2020, 1, 1), 'a', 1]).sql != statement.sql
+    assert 'NULLS FIRST' in keyset('before', None).sql
+
+
+def test_deferred():
+    model = UserModel()
+    args = model.parse_arguments({'sort': '-article-count,last', 'filter[status]': 'active'})
+    model.init_schema(args)
+
+    def page(offset, **kwargs):
+        return select_many(model, order_by=model.get_order_by(args), filter_by=model.get_filter_by(args),
+                           limit=10, offset=offset, deferred=True, **kwargs)
+
+    statement = check(page, (1000,), (2000,))
+    assert statement.args[-3:] == [10, 2000, 'active']
+    assert statement.sql.endswith('ORDER BY {0}.{0}'.format(PAGE_LABEL))
+    assert statement.sql.count('GROUP BY') == 2
+    assert '{}.{}'.format(PAGE_LABEL, WINDOW_LABEL) in page(1000, window=True).sql
+    args = model.parse_arguments({'filter[articles.title]': 'a'})
+    model.init_schema(args)
+    assert PAGE_LABEL not in page(1000).sql
+
+
+def test_render():
+    model = ArticleModel()
+    args = model.parse_arguments({'sort': '-created-on', 'fields[article]': 'title,body,created-on'})
+    model.init_schema(args)
+
+    def render(limit, **kwargs):
+        return select_many(model, order_by=model.get_order_by(args), limit=limit, render=True, **kwargs)
+
+    statement = check(render, (10,), (20,))
+    assert statement.args == [20, 0]
+    assert 'AS {}'.format(RENDER_LABEL) in statement.sql
+    assert "'createdOn', to_char(timezone('UTC'" in statement.sql
+    assert "'updatedOn'" not in statement.sql
+    assert statement.sql != select_many(model, order_by=model.get_order_by(args), limit=10).sql
+    assert '{}.{}'.format(RENDER_LABEL, WINDOW_LABEL) in render(10, window=True).sql
+    assert PAGE_LABEL in render(10, offset=1000, deferred=True).sql
+
+
+def test_version():
+    model = UserModel()
+    args = model.parse_arguments({'filter[email:eq]': 'a@b.c'})
+    model.init_schema(args)
+    statement = check(lambda term: select_version(model, filter_by=model.get_filter_by(args), search_term=term),
+                      ('john',), ('jane',))
+    assert statement.args[0] == 'a@b.c'
+    assert statement.args[-1] == 'jane'
+    assert 'sum(count.{})'.format(VERSION_LABEL) in statement.sql
+    assert 'public.user_names.xmin' in statement.sql
+    assert 'ORDER BY' not in statement.sql
+    assert 'GROUP BY' not in statement.sql
+    assert 'AS email' not in statement.sql
+    args = model.parse_arguments({'filter[article-count:gt]': '1', 'fields[user]': 'email,article-count'})
+    model.init_schema(args)
+    statement = select_version(model, filter_by=model.get_filter_by(args))
+    assert statement.sql.count('JOIN') == 2
+    assert 'GROUP BY public.users.id' in statement.sql
+    assert 'max(' in statement.sql
+    model.init_schema(model.parse_arguments({'fields[user]': 'email,article-count'}))
+    assert 'JOIN public.articles' not in select_version(model).sql
+    statement = check(lambda object_id: select_version(model, object_id), (1,), (2,))
+    assert statement.args == [2]
+    try:
+        model = ArticleModel()
+        model.init_schema()
+        login(1)
+        assert check(lambda object_id: select_version(model, object_id), (1,), (2,)).args == [2, 1]
+        model.version = 'updated_on'
+        statement = select_version(model)
+        assert 'max(count.{})'.format(VERSION_LABEL) in statement.sql
+        assert 'xmin' not in statement.sql
+    finally:
+        logout()
+
+
+def test_embedded():
+    model = UserModel().configure(UserModel().parse_arguments({'include': 'articles.comments'}))
+    embed = ((model.fields['articles'], ((model.fields['articles'].model.fields['comments'], ()),)),)
+    statement = check(lambda object_id: one(model, object_id, embed), (1,), (2,))
+    assert 'json_agg' in statement.sql
+    assert statement.sql != one(model, 2).sql
+    assert statement_cache.stats()['size'] == 2
+
+
+def test_outer_order():
+    model = UserModel().configure(UserModel().parse_arguments({'include': 'articles', 'sort': '-email'}))
+    order_by = model.get_order_by(model.parse_arguments({'sort': '-email'}))
+    embed = ((model.fields['articles'], ()),)
+    statement = select_many(model, order_by=order_by, limit=10, embed=embed)
+    assert statement.sql.endswith('AS {0} ORDER BY {0}._order_0 DESC NULLS LAST'.format(EMBED_LABEL))
+    statement = select_many(model, order_by=order_by, limit=10, embed=embed, keyset=('before', None))
+    assert statement.sql.endswith('ORDER BY {0}._order_0 ASC NULLS FIRST, {0}._order_1 DESC NULLS FIRST'.format(
+        EMBED_LABEL))
+    statement = select_many(model, order_by=order_by, limit=10, offset=1000, embed=embed, deferred=True)
+    assert statement.sql.endswith('AS {0} ORDER BY {0}.{1} ASC'.format(EMBED_LABEL, PAGE_LABEL))
+    statement = select_many(model, order_by=order_by, limit=10, render=True)
+    assert statement.sql.endswith('AS {0} ORDER BY {0}._order_0 DESC NULLS LAST'.format(RENDER_LABEL))
+    assert '_order_0' not in select_many(model, order_by=order_by, limit=10).sql
+
+
+def test_uncached():
+    statement_cache.clear()
+    model = UserModel()
+    model.init_schema()
+    assert not isinstance(select_many(model, where=model.primary_key > 10), Statement)
+    assert len(statement_cache) == 0
@@ -1,7 +1,7 @@
 import datetime as dt
 import random
 from contextlib import asynccontextmanager
-from json import dumps as json_dumps
+from json import dumps as json_dumps, loads as json_loads
 
 from inflection import camelize, underscore
 
@@ -55,6 +55,28 @@ async def get_collection(args, *models, **kwargs):
         logout_user(user_id)
 
 
+@asynccontextmanager
+async def stream_collection(args, model, **kwargs):
+    user_id = login_user(kwargs.pop('login', None))
+    try:
+        chunks = [chunk async for chunk in model.stream_collection(args, **kwargs)]
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        yield json_loads(b''.join(chunks)), len(chunks)
+    finally:
+        logout_user(user_id)
+
+
+@asynccontextmanager
+async def render_collection(args, model, **kwargs):
+    user_id = login_user(kwargs.pop('login', None))
+    try:
+        document = await model.render_collection(args, **kwargs)
+        assert isinstance(document, bytes)
+        yield json_loads(document)
+    finally:
+        logout_user(user_id)
+
+
 @asynccontextmanager
 async def get_related(args, model, object_id, name, **kwargs):
     user_id = login_user(kwargs.pop('login', None))